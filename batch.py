@@ -0,0 +1,144 @@
+"""Headless batch scrambling over a directory or glob of images
+
+    python batch.py scramble Inputs/ --iterations 3 --workers 8
+    python batch.py unscramble "Scrambled/*.ppm" --iterations 3
+
+Files are fanned out over a process pool with a bounded number of jobs in
+flight. Outputs are written atomically, so an interrupted run can simply be
+restarted: files whose output already exists and is newer than the input
+are skipped.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import catmap
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    "scramble": ("Scrambled", "_scrambled"),
+    "unscramble": ("Outputs", "_unscrambled"),
+}
+
+def collect_inputs(patterns):
+    """Expand directories and glob patterns into a sorted list of image paths"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern)
+        for path in candidates:
+            # Temporaries left by a killed worker of an older version
+            # were named stem.<pid>.tmp.ext
+            if ".tmp." in os.path.basename(path):
+                continue
+            if os.path.isfile(path) and path.lower().endswith(catmap.IMAGE_EXTENSIONS):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def output_path_for(input_path, mode, output_dir):
+    """Name the output the same way the GUI does"""
+    stem, ext = os.path.splitext(os.path.basename(input_path))
+    return os.path.join(output_dir, stem + MODES[mode][1] + ext)
+
+
+def is_up_to_date(input_path, output_path):
+    """True when the output exists and is at least as new as its input"""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    except OSError:
+        return False
+
+
+def process_file(mode, input_path, output_path, iterations, legacy, backend, threads, size):
+    """Worker entry point: run one file and return its wall time in seconds"""
+    start = time.perf_counter()
+    transform = catmap.scramble if mode == "scramble" else catmap.unscramble
+    # Every engine writes beside the target and renames, so a crash never
+    # leaves a truncated file that looks up to date on the next run
+    transform(input_path, output_path, iterations, legacy, backend, threads, size)
+    return time.perf_counter() - start
+
+
+def run_batch(mode, inputs, output_dir, iterations, legacy=False, backend=None,
+              workers=None, max_in_flight=None, force=False, threads=1, size=None, log=print):
+    """Process every input and return (done, skipped, failed) counts"""
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    skipped = 0
+    for input_path in inputs:
+        output_path = output_path_for(input_path, mode, output_dir)
+        if not force and is_up_to_date(input_path, output_path):
+            skipped += 1
+            continue
+        jobs.append((input_path, output_path))
+
+    workers = workers or os.cpu_count() or 1
+    # Each in-flight job holds roughly one decoded image per process
+    max_in_flight = max_in_flight or 2 * workers
+    done = failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        queue = iter(jobs)
+        while True:
+            for input_path, output_path in queue:
+                future = pool.submit(process_file, mode, input_path, output_path,
+                                     iterations, legacy, backend, threads, size)
+                pending[future] = input_path
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                input_path = pending.pop(future)
+                name = os.path.basename(input_path)
+                try:
+                    elapsed = future.result()
+                except Exception as e:
+                    failed += 1
+                    log(f"FAILED {name}: {e}")
+                else:
+                    done += 1
+                    log(f"{mode.upper()} {name} {elapsed:.3f}s")
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    log(f"{done} done, {skipped} skipped, {failed} failed in {elapsed:.2f}s ({rate:.1f} files/s)")
+    return done, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scramble or unscramble images in bulk")
+    parser.add_argument("mode", choices=sorted(MODES))
+    parser.add_argument("inputs", nargs="*", help="directories or glob patterns (default: Inputs/)")
+    parser.add_argument("-k", "--iterations", type=catmap.iteration_count, default=3)
+    parser.add_argument("--legacy", action="store_true", help="use the old k^2 iteration semantics")
+    parser.add_argument("-o", "--output-dir", help="default: Scrambled/ or Outputs/")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, help="jobs queued at once (default: 2 x workers)")
+    parser.add_argument("--backend", choices=sorted(catmap.BACKENDS))
+    parser.add_argument("--threads", type=int, default=1,
+                        help="native kernel threads per worker (default: 1, 0 = all cores)")
+    parser.add_argument("--force", action="store_true", help="reprocess up-to-date outputs")
+    parser.add_argument("--size", type=catmap.parse_size, help="WIDTHxHEIGHT of raw .rgb/.rgba inputs")
+    args = parser.parse_args(argv)
+
+    inputs = collect_inputs(args.inputs or [os.path.join(BASE_DIR, "Inputs")])
+    output_dir = args.output_dir or os.path.join(BASE_DIR, MODES[args.mode][0])
+    _, _, failed = run_batch(
+        args.mode, inputs, output_dir, args.iterations, args.legacy, args.backend,
+        args.workers, args.max_in_flight, args.force, args.threads, args.size,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Throughput of the NumPy permutation strategies, in megapixels per second
+
+    python bench_permute.py
+    python bench_permute.py --sizes 512 1024 2048 4096 8192 --repeat 5
+
+table  gather through a prebuilt, cached full-size index (warm batch case)
+cold   build the full-size index and gather (first image of a size)
+tiled  build and gather one block of destination rows at a time
+"""
+import argparse
+import time
+
+import numpy as np
+
+import catmap
+
+DEFAULT_SIZES = (512, 1024, 2048, 4096, 8192)
+MODES = ("table", "cold", "tiled")
+
+
+def best_time(func, repeat):
+    """Best wall time of `repeat` runs, which filters scheduler noise"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_size(n, iterations, repeat):
+    """Return {mode: megapixels per second} for one image size"""
+    pixels = np.random.default_rng(n).integers(0, 256, (n, n, 3), dtype=np.uint8)
+    matrix = catmap.transform_matrix(n, iterations)
+    # Cached tables are stored as intp, which np.take uses without a copy
+    table = catmap.gather_index(matrix, n).astype(np.intp)
+    runs = {
+        "table": lambda: catmap.permute(pixels, table),
+        "cold": lambda: catmap.permute(pixels, catmap.gather_index(matrix, n)),
+        "tiled": lambda: catmap.permute_tiled(pixels, matrix),
+    }
+    megapixels = n * n / 1e6
+    return {mode: megapixels / best_time(runs[mode], repeat) for mode in MODES}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy permutation strategies")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("-k", "--iterations", type=catmap.iteration_count, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'N':>6} " + " ".join(f"{mode + ' MP/s':>12}" for mode in MODES))
+    for n in args.sizes:
+        results = bench_size(n, args.iterations, args.repeat)
+        print(f"{n:>6} " + " ".join(f"{results[mode]:>12.1f}" for mode in MODES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""End-to-end benchmark and regression check for scramble/unscramble
+
+    python benchmark.py --output results.json
+    python benchmark.py --sizes 1024 4096 1920x1080 -k 1 3 --threads 1 0
+    python benchmark.py --baseline baseline.json --tolerance 0.15
+
+Every configuration (size, iterations, backend, threads) runs in a fresh
+worker process, so its peak RSS is its own. Each one reports:
+
+file     megapixels/s for scramble over PPM files on disk
+unscr    megapixels/s for unscramble over the same files
+permute  megapixels/s for the same permutation on an in-memory array
+io       seconds per file spent outside the permutation (mapping, paging,
+         writing), taken as file time minus permute time
+rss      peak resident set size of the worker in MiB
+
+Both file and in-memory paths are round-tripped, and a configuration
+whose unscramble(scramble(x)) differs from x fails the run. With
+--baseline, file throughput in either direction that drops more than
+--tolerance below the stored value is flagged as a regression. Either
+failure sets the exit status to 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import catmap
+import ppm
+from bench_permute import best_time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = ("512", "1024", "2048")
+DEFAULT_ITERATIONS = (1, 3, 10)
+DEFAULT_TOLERANCE = 0.15
+
+
+def config_key(config):
+    width, height = config["size"]
+    return f"{config['backend']}/{width}x{height}/k={config['iterations']}/t={config['threads']}"
+
+
+def peak_rss_mib():
+    """Peak resident set size of this process, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_config(config, workdir, repeat):
+    """Worker entry point: benchmark one configuration and return its record"""
+    width, height = config["size"]
+    iterations, threads = config["iterations"], config["threads"]
+    engine = catmap.get_backend(config["backend"])
+    prefix = os.path.join(workdir, config_key(config).replace("/", "_"))
+    source, scrambled, restored = (f"{prefix}_{name}.ppm" for name in ("in", "scrambled", "out"))
+
+    pixels = np.random.default_rng(width * height).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    ppm.write_ppm(source, pixels)
+    try:
+        # The first call builds and caches the permutation table
+        start = time.perf_counter()
+        engine.scramble(source, scrambled, iterations, threads=threads)
+        cold = time.perf_counter() - start
+
+        file_time = best_time(lambda: engine.scramble(source, scrambled, iterations, threads=threads), repeat)
+        out = np.empty_like(pixels)
+        permute_time = best_time(
+            lambda: engine.scramble_array(pixels, iterations, threads=threads, out=out), repeat)
+
+        unscramble_time = best_time(
+            lambda: engine.unscramble(scrambled, restored, iterations, threads=threads), repeat)
+        file_ok = np.array_equal(ppm.read_ppm(restored), pixels)
+        memory_ok = np.array_equal(engine.unscramble_array(out, iterations, threads=threads), pixels)
+    finally:
+        for path in (source, scrambled, restored):
+            if os.path.exists(path):
+                os.remove(path)
+
+    megapixels = width * height / 1e6
+    return dict(
+        config,
+        key=config_key(config),
+        cold_s=cold,
+        file_s=file_time,
+        unscramble_s=unscramble_time,
+        permute_s=permute_time,
+        io_s=max(file_time - permute_time, 0.0),
+        file_mp_s=megapixels / file_time,
+        unscramble_mp_s=megapixels / unscramble_time,
+        permute_mp_s=megapixels / permute_time,
+        peak_rss_mib=peak_rss_mib(),
+        round_trip=file_ok and memory_ok,
+    )
+
+
+def configurations(sizes, iterations, backends, threads):
+    for backend in backends:
+        # Thread count only means something to the native kernel
+        for thread_count in (threads if backend == "native" else (1,)):
+            for size in sizes:
+                for k in iterations:
+                    yield dict(backend=backend, size=size, iterations=k, threads=thread_count)
+
+
+def run_benchmark(configs, repeat=3, log=print):
+    """Run every configuration in its own process and return the records"""
+    workdir = tempfile.mkdtemp(prefix="catmap_bench_")
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for config in configs:
+            # A fresh process per configuration keeps peak RSS and the
+            # permutation cache from leaking between runs
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                record = pool.submit(run_config, config, workdir, repeat).result()
+            results.append(record)
+            log(format_record(record))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_record(record):
+    rss = "-" if record["peak_rss_mib"] is None else f"{record['peak_rss_mib']:.0f}"
+    status = "ok" if record["round_trip"] else "ROUND TRIP FAILED"
+    return (f"{record['key']:<32} {record['file_mp_s']:>9.1f} {record['unscramble_mp_s']:>9.1f} "
+            f"{record['permute_mp_s']:>9.1f} {record['io_s'] * 1000:>9.2f} {rss:>7} {status}")
+
+
+def compare(results, baseline, tolerance):
+    """Return (key, metric, baseline MP/s, current MP/s) for every regression"""
+    previous = {record["key"]: record for record in baseline["results"]}
+    regressions = []
+    for record in results:
+        old = previous.get(record["key"], {})
+        for metric in ("file_mp_s", "unscramble_mp_s"):
+            if metric in old and record[metric] < old[metric] * (1 - tolerance):
+                regressions.append((record["key"], metric, old[metric], record[metric]))
+    return regressions
+
+
+def metadata():
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scramble/unscramble end to end")
+    parser.add_argument("--sizes", type=catmap.parse_size, nargs="+",
+                        default=[catmap.parse_size(s) for s in DEFAULT_SIZES],
+                        help="N or WIDTHxHEIGHT")
+    parser.add_argument("-k", "--iterations", type=catmap.iteration_count, nargs="+", default=DEFAULT_ITERATIONS)
+    parser.add_argument("--backends", nargs="+", choices=sorted(catmap.BACKENDS),
+                        help="default: every backend that loads")
+    parser.add_argument("--threads", type=int, nargs="+", default=(1, 0),
+                        help="native kernel thread counts (0 = all cores)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed fractional throughput drop (default: 0.15)")
+    args = parser.parse_args(argv)
+
+    backends = args.backends or catmap.available_backends()
+    print(f"{'configuration':<32} {'file MP/s':>9} {'unscr':>9} {'perm MP/s':>9} {'io ms':>9} {'rss MiB':>7}")
+    results = run_benchmark(configurations(args.sizes, args.iterations, backends, args.threads), args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": metadata(), "results": results}, f, indent=2)
+
+    status = 0
+    failures = [record["key"] for record in results if not record["round_trip"]]
+    for key in failures:
+        print(f"ROUND TRIP FAILED {key}")
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for key, metric, old, new in regressions:
+            print(f"REGRESSION {key} {metric}: {old:.1f} -> {new:.1f} MP/s ({new / old - 1:+.0%})")
+            status = 1
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
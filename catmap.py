@@ -0,0 +1,740 @@
+"""Arnold cat map engines and backend selection
+
+The NumPy engine reproduces Image::scrambleImage / unscrambleImage from
+image_encryptor.cpp byte for byte. Instead of scattering pixel by pixel it
+builds the permutation for the whole transform once and applies it as a
+single gather over the (N, N, 3) pixel array.
+
+`iterations` means a single pass of T^iterations. Pass legacy=True for
+files written by the original engine, whose k passes of T^k add up to
+T^(k^2).
+
+Transforms accept progress(done, total), called as row blocks (and, for
+rectangles, index-building passes) complete. Raising Cancelled, or any
+other exception, from the callback abandons the transform.
+"""
+import argparse
+import ctypes
+import functools
+import os
+import sys
+
+import numpy as np
+
+import ppm
+from perm_cache import PermutationCache, default_cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Arnold cat map and its inverse mod N (both have determinant 1)
+CAT_MAP = ((1, 1), (1, 2))
+INVERSE_CAT_MAP = ((2, -1), (-1, 1))
+
+# Lossless formats decoded through Pillow; a lossy format would destroy
+# the permutation
+PIL_EXTENSIONS = (".png", ".bmp", ".tif", ".tiff")
+# Headerless 8-bit raw pixels, mapped directly; they need an explicit size
+RAW_CHANNELS = {".rgb": 3, ".rgba": 4}
+IMAGE_EXTENSIONS = (".ppm",) + tuple(RAW_CHANNELS) + PIL_EXTENSIONS
+
+# Tables of keyed maps stay in memory: on-disk names would expose the
+# shear pair
+keyed_cache = PermutationCache()
+
+# Destination pixels per block in tiled mode: 256K int32 indices (1 MiB)
+TILE_PIXELS = 1 << 18
+
+# Fastest first; get_backend() picks the first one that loads
+BACKEND_ORDER = ("native", "numpy")
+BACKEND_ENV = "IMAGE_ENCRYPTOR_BACKEND"
+
+
+class Cancelled(Exception):
+    """Raised by a progress callback to abandon a running transform"""
+
+
+def mat_mul(a, b, n):
+    """Multiply two 2x2 matrices mod n"""
+    return (
+        ((a[0][0] * b[0][0] + a[0][1] * b[1][0]) % n,
+         (a[0][0] * b[0][1] + a[0][1] * b[1][1]) % n),
+        ((a[1][0] * b[0][0] + a[1][1] * b[1][0]) % n,
+         (a[1][0] * b[0][1] + a[1][1] * b[1][1]) % n),
+    )
+
+
+def mat_pow(m, exp, n):
+    """Raise a 2x2 matrix to a non-negative power mod n"""
+    result = ((1 % n, 0), (0, 1 % n))
+    base = tuple(tuple(v % n for v in row) for row in m)
+    while exp > 0:
+        if exp & 1:
+            result = mat_mul(result, base, n)
+        base = mat_mul(base, base, n)
+        exp >>= 1
+    return result
+
+
+def shear_map(p, q):
+    """Keyed cat map [[1, p], [q, pq + 1]]: shear x += p*y, then y += q*x
+
+    p = q = 1 is the classic map. The determinant is 1 for any pair, so
+    the inverse is the adjugate.
+    """
+    return ((1, p), (q, p * q + 1))
+
+
+def is_keyed(shear):
+    """True for a shear pair other than the classic (1, 1)"""
+    return shear is not None and tuple(shear) != (1, 1)
+
+
+@functools.lru_cache(maxsize=None)
+def cat_map_period(n):
+    """Return the smallest p > 0 with T^p == I (mod n); it never exceeds 3n"""
+    identity = ((1 % n, 0), (0, 1 % n))
+    m = mat_pow(CAT_MAP, 1, n)
+    period = 1
+    while m != identity:
+        m = mat_mul(m, CAT_MAP, n)
+        period += 1
+    return period
+
+
+def net_exponent(n, iterations, legacy=False):
+    """Return the power of T one scramble applies, reduced by the period
+
+    Legacy files were written by k passes that each raised the map to the
+    k-th power, so their net transform is T^(k^2).
+    """
+    exponent = iterations * iterations if legacy else iterations
+    return exponent % cat_map_period(n)
+
+
+def transform_matrix(n, iterations, inverse=False, legacy=False, shear=None):
+    """Return the net matrix applied to an n x n image in a single pass"""
+    if is_keyed(shear):
+        (a, b), (c, d) = shear_map(*shear)
+        base = ((d, -b), (-c, a)) if inverse else ((a, b), (c, d))
+        # No cheap period to reduce a keyed map by; the power is O(log k)
+        return mat_pow(base, iterations * iterations if legacy else iterations, n)
+    base = INVERSE_CAT_MAP if inverse else CAT_MAP
+    return mat_pow(base, net_exponent(n, iterations, legacy), n)
+
+
+def index_dtype(n):
+    """Smallest integer dtype that can address every pixel of an n x n image"""
+    return np.int32 if n * n <= np.iinfo(np.int32).max else np.int64
+
+
+def gather_index(matrix, n, start=0, stop=None):
+    """Return the flat source index of every pixel in destination rows [start, stop)
+
+    The C++ loops scatter row i, column j to row y, column x, where
+    (x, y) = matrix . (j, i). The gather form needs the inverse, which for
+    a determinant 1 matrix is the adjugate.
+    """
+    (a, b), (c, d) = matrix
+    dtype = index_dtype(n)
+    y = np.arange(start, n if stop is None else stop, dtype=dtype)
+    x = np.arange(n, dtype=dtype)
+    # Reduce each term mod n first so the sums never leave [0, 2n)
+    col = (-b * y % n)[:, None] + (d * x % n)[None, :]
+    col[col >= n] -= n
+    row = (a * y % n)[:, None] + (-c * x % n)[None, :]
+    row[row >= n] -= n
+    row *= n
+    row += col
+    return row.ravel()
+
+
+def permutation(n, iterations, inverse=False, legacy=False, cache=None, shear=None):
+    """Return the (cached) gather index for one scramble or unscramble"""
+    if is_keyed(shear):
+        key = (n, iterations, legacy, "unscramble" if inverse else "scramble") + tuple(shear)
+        return (cache or keyed_cache).get(
+            key, lambda: gather_index(transform_matrix(n, iterations, inverse, legacy, shear), n))
+    cache = cache or default_cache
+    # Keyed by the reduced exponent, so equivalent iteration counts and
+    # legacy/single-pass requests for the same transform share one table
+    exponent = net_exponent(n, iterations, legacy)
+    key = (n, exponent, "unscramble" if inverse else "scramble")
+    return cache.get(key, lambda: gather_index(transform_matrix(n, exponent, inverse), n))
+
+
+def permute(pixels, index, out=None, progress=None, done=0, total=None):
+    """Gather the pixels of an image through a flat index
+
+    `out` must be a writable C-contiguous array of the same shape, such as
+    a writable memmap, so the result can go straight into a mapped output
+    file. With a progress
+    callback the gather runs in row blocks, reporting done + rows
+    finished out of total (default: the image height).
+    """
+    height, width = pixels.shape[:2]
+    flat = pixels.reshape(height * width, -1)
+    if out is None:
+        out = np.empty_like(pixels)
+    out_flat = out.reshape(height * width, -1)
+    # Every index is in range, and unlike the default mode="raise", "wrap"
+    # writes straight into out instead of into a temporary it copies back
+    if progress is None:
+        np.take(flat, index, axis=0, out=out_flat, mode="wrap")
+        return out
+    total = total or height
+    block_rows = max(1, TILE_PIXELS // width)
+    for start in range(0, height, block_rows):
+        stop = min(start + block_rows, height)
+        np.take(flat, index[start * width:stop * width], axis=0, out=out_flat[start * width:stop * width],
+                mode="wrap")
+        progress(done + stop, total)
+    return out
+
+
+def permute_tiled(pixels, matrix, block_rows=None, out=None, progress=None):
+    """Gather a square image one block of destination rows at a time
+
+    Only a block's worth of index is ever built, so memory stays flat for
+    very large images. Each block's index and output rows stay in cache
+    while its gather runs, and the output is written in order.
+    """
+    n = pixels.shape[0]
+    block_rows = block_rows or max(1, TILE_PIXELS // n)
+    flat = pixels.reshape(n * n, -1)
+    if out is None:
+        out = np.empty_like(pixels)
+    out_flat = out.reshape(n * n, -1)
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        np.take(flat, gather_index(matrix, n, start, stop), axis=0, out=out_flat[start * n:stop * n],
+                mode="wrap")
+        if progress is not None:
+            progress(stop, n)
+    return out
+
+
+def rect_step_index(width, height, inverse=False, shear=None):
+    """Gather index of one step of the generalized cat map on a rectangle
+
+    T is the product of two shears, x += p*y (mod width) then y += q*x
+    (mod height), and each shear stays a bijection when width != height.
+    For a square this is exactly shear_map(p, q), so the two definitions
+    agree.
+    """
+    p, q = shear or (1, 1)
+    dtype = np.int32 if width * height <= np.iinfo(np.int32).max else np.int64
+    y, x = np.divmod(np.arange(width * height, dtype=dtype), width)
+    # Reduced factors keep every product below width * height
+    x_new = (x + p % width * y) % width
+    y_new = (y + q % height * x_new) % height
+    scatter = y_new * width + x_new
+    if inverse:
+        return scatter
+    gather = np.empty_like(scatter)
+    gather[scatter] = np.arange(width * height, dtype=dtype)
+    return gather
+
+
+def power_passes(exp):
+    """Number of compositions power_permutation makes for an exponent"""
+    return exp.bit_length() - 1 + bin(exp).count("1") if exp > 0 else 0
+
+
+def power_permutation(base, exp, step=None):
+    """Raise a gather permutation to a non-negative power by repeated squaring
+
+    step(), when given, is called after every composition.
+    """
+    result = np.arange(base.size, dtype=base.dtype)
+    while exp > 0:
+        if exp & 1:
+            result = result[base]
+            if step is not None:
+                step()
+        exp >>= 1
+        if exp:
+            base = base[base]
+            if step is not None:
+                step()
+    return result
+
+
+def rect_permutation(width, height, iterations, inverse=False, legacy=False, cache=None, step=None,
+                     shear=None):
+    """Return the (cached) gather index for a rectangular image
+
+    There is no matrix form to reduce by a period, so the one-step
+    permutation is raised to k (or k^2) in O(log k) compositions. step()
+    is called after each pass of a fresh build.
+    """
+    exponent = iterations * iterations if legacy else iterations
+    key = (width, height, exponent, "unscramble" if inverse else "scramble")
+    if is_keyed(shear):
+        key += tuple(shear)
+        cache = cache or keyed_cache
+    cache = cache or default_cache
+
+    def build():
+        base = rect_step_index(width, height, inverse, shear)
+        if step is not None:
+            step()
+        return power_permutation(base, exponent, step)
+
+    return cache.get(key, build)
+
+
+def _apply_rect(pixels, iterations, inverse, legacy, out, progress, shear):
+    height, width = pixels.shape[:2]
+    if progress is None:
+        index = rect_permutation(width, height, iterations, inverse, legacy, shear=shear)
+        return permute(pixels, index, out=out)
+
+    # Each build pass counts as one image height of work, as in the
+    # native engine; a cached table skips straight past them
+    passes = 1 + power_passes(iterations * iterations if legacy else iterations)
+    total = height * (passes + 1)
+    done = [0]
+
+    def step():
+        done[0] += height
+        progress(done[0], total)
+
+    index = rect_permutation(width, height, iterations, inverse, legacy, step=step, shear=shear)
+    return permute(pixels, index, out, progress, passes * height, total)
+
+
+def check_iterations(iterations):
+    """Reject iteration counts the engines would disagree on
+
+    Python reduces -1 to period - 1 (the inverse map) while C++ keeps the
+    sign, so negative counts are refused rather than given two meanings.
+    """
+    if iterations < 0:
+        raise ValueError(f"iterations must be non-negative, got {iterations}")
+
+
+def iteration_count(text):
+    """argparse type for a non-negative iteration count"""
+    iterations = int(text)
+    check_iterations(iterations)
+    return iterations
+
+
+def _apply(pixels, iterations, inverse, legacy, tiled, out=None, progress=None, shear=None):
+    check_iterations(iterations)
+    height, n = pixels.shape[:2]
+    if not height or not n:
+        raise ValueError(f"Cannot scramble an empty {n}x{height} image")
+    if n != height:
+        return _apply_rect(pixels, iterations, inverse, legacy, out, progress, shear)
+    if tiled is None:
+        # A table over the cache budget would be rebuilt on every call
+        # anyway, so build it block by block instead
+        tiled = n * n * np.dtype(np.intp).itemsize > default_cache.max_bytes
+    if tiled:
+        matrix = transform_matrix(n, iterations, inverse, legacy, shear)
+        return permute_tiled(pixels, matrix, out=out, progress=progress)
+    return permute(pixels, permutation(n, iterations, inverse, legacy, shear=shear), out, progress)
+
+
+def scramble_array(pixels, iterations, legacy=False, tiled=None, out=None, progress=None, shear=None):
+    """Scramble an (height, width, channels) array in a single pass
+
+    tiled forces (True) or disables (False) the blocked gather for square
+    images; by default it is used only when the table would not fit in the
+    cache.
+    The result is written to `out` when given, which must not overlap
+    `pixels`. shear=(p, q) selects a keyed variant of the map.
+    """
+    return _apply(pixels, iterations, False, legacy, tiled, out, progress, shear)
+
+
+def unscramble_array(pixels, iterations, legacy=False, tiled=None, out=None, progress=None, shear=None):
+    """Unscramble an (height, width, channels) array in a single pass"""
+    return _apply(pixels, iterations, True, legacy, tiled, out, progress, shear)
+
+
+def transform_file(input_path, output_path, iterations, inverse=False, legacy=False, progress=None):
+    """Permute one mapped PPM straight into another mapped PPM
+
+    Neither image is loaded into memory: the input payload is mapped
+    read-only, the output is preallocated and mapped, and the gather
+    writes into it directly. The output is built beside the target and
+    renamed into place, which also makes input_path == output_path safe.
+    """
+    width, height, maxval, _ = ppm.read_header(input_path)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        src = ppm.open_ppm(input_path)
+        dst = ppm.create_ppm(tmp_path, width, height, maxval)
+        _apply(src, iterations, inverse, legacy, None, dst, progress)
+        dst.flush()
+        # Drop both mappings before the rename; Windows refuses to replace
+        # a file that is still mapped
+        del src, dst
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def check_out(pixels, out):
+    """Reject an `out` array the engines cannot write through in place"""
+    if out.shape != pixels.shape or out.dtype != pixels.dtype:
+        raise ValueError("out must match the shape and dtype of the image")
+    if not (out.flags.c_contiguous and out.flags.writeable):
+        raise ValueError("out must be a writable C-contiguous array")
+
+
+class NumpyBackend:
+    """Pure NumPy engine, available wherever NumPy is"""
+
+    name = "numpy"
+
+    # threads is accepted for interface parity; the gather is single-threaded
+    def scramble(self, input_path, output_path, iterations, legacy=False, threads=None, progress=None):
+        transform_file(input_path, output_path, iterations, False, legacy, progress)
+
+    def unscramble(self, input_path, output_path, iterations, legacy=False, threads=None, progress=None):
+        transform_file(input_path, output_path, iterations, True, legacy, progress)
+
+    def _transform_array(self, pixels, iterations, inverse, legacy, out, progress, shear):
+        if out is not None:
+            check_out(pixels, out)
+        if out is not None and np.shares_memory(out, pixels):
+            # The tiled gather reads rows that earlier blocks would overwrite
+            out[...] = _apply(pixels, iterations, inverse, legacy, None, None, progress, shear)
+            return out
+        return _apply(pixels, iterations, inverse, legacy, None, out, progress, shear)
+
+    def scramble_array(self, pixels, iterations, legacy=False, threads=None, out=None, progress=None,
+                       shear=None):
+        return self._transform_array(pixels, iterations, False, legacy, out, progress, shear)
+
+    def unscramble_array(self, pixels, iterations, legacy=False, threads=None, out=None, progress=None,
+                         shear=None):
+        return self._transform_array(pixels, iterations, True, legacy, out, progress, shear)
+
+
+# int (*)(long long done, long long total, void *context); non-zero cancels
+PROGRESS_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_void_p)
+NATIVE_CANCELLED = -2
+
+
+def native_library_path():
+    """Return the platform file name of the compiled image_encryptor library"""
+    if sys.platform == "win32":
+        name = "image_encryptor.dll"
+    elif sys.platform == "darwin":
+        name = "libimage_encryptor.dylib"
+    else:
+        name = "libimage_encryptor.so"
+    return os.path.join(BASE_DIR, name)
+
+
+class NativeBackend:
+    """ctypes binding for the C++ engine in image_encryptor.cpp
+
+    Functions loaded through ctypes.CDLL release the GIL for the duration
+    of the call, so other Python threads (the GUI, a server loop) keep
+    running while the kernel works.
+    """
+
+    name = "native"
+
+    def __init__(self, path=None):
+        self.lib = ctypes.CDLL(path or native_library_path())
+        try:
+            for func in (self.lib.scramble_progress, self.lib.unscramble_progress):
+                func.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_longlong, ctypes.c_int, ctypes.c_int,
+                                 PROGRESS_CALLBACK, ctypes.c_void_p]
+                func.restype = ctypes.c_int
+            for func in (self.lib.scramble_keyed_buffer, self.lib.unscramble_keyed_buffer):
+                func.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                 ctypes.c_longlong, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                 PROGRESS_CALLBACK, ctypes.c_void_p]
+                func.restype = ctypes.c_int
+        except AttributeError as e:
+            raise OSError(f"Native library is out of date ({e}); rebuild image_encryptor.cpp")
+
+    def _run(self, func, args, progress):
+        """Call a kernel with an optional progress callback
+
+        ctypes cannot propagate an exception out of a callback, so it is
+        caught, turned into a cancel, and re-raised once the call returns.
+        """
+        if progress is None:
+            return func(*args, PROGRESS_CALLBACK(), None)
+        errors = []
+
+        def callback(done, total, context):
+            try:
+                progress(done, total)
+            except BaseException as e:
+                errors.append(e)
+                return 1
+            return 0
+
+        status = func(*args, PROGRESS_CALLBACK(callback), None)
+        if errors:
+            raise errors[0]
+        return status
+
+    def _call(self, func, input_path, output_path, iterations, legacy, threads, progress):
+        check_iterations(iterations)
+        # None (and 0) let the library use one thread per hardware thread
+        args = (os.fsencode(input_path), os.fsencode(output_path), iterations, legacy, threads or 0)
+        status = self._run(func, args, progress)
+        if status == NATIVE_CANCELLED:
+            raise Cancelled(input_path)
+        if status != 0:
+            raise RuntimeError(f"Native engine failed on {input_path}")
+
+    def scramble(self, input_path, output_path, iterations, legacy=False, threads=None, progress=None):
+        self._call(self.lib.scramble_progress, input_path, output_path, iterations, legacy, threads, progress)
+
+    def unscramble(self, input_path, output_path, iterations, legacy=False, threads=None, progress=None):
+        self._call(self.lib.unscramble_progress, input_path, output_path, iterations, legacy, threads, progress)
+
+    def _call_buffer(self, func, pixels, iterations, legacy, threads, out, progress, shear):
+        check_iterations(iterations)
+        pixels = np.ascontiguousarray(pixels)
+        if out is None:
+            out = np.empty_like(pixels)
+        else:
+            check_out(pixels, out)
+        height, width = pixels.shape[:2]
+        pixel_bytes = pixels.nbytes // (height * width) if pixels.size else 0
+        p, q = shear or (1, 1)
+        args = (pixels.ctypes.data, out.ctypes.data, width, height, pixel_bytes, iterations, legacy, p, q,
+                threads or 0)
+        status = self._run(func, args, progress)
+        if status == NATIVE_CANCELLED:
+            raise Cancelled()
+        if status != 0:
+            raise ValueError(f"Native engine rejected a {width}x{height} image of {pixel_bytes}-byte pixels")
+        return out
+
+    def scramble_array(self, pixels, iterations, legacy=False, threads=None, out=None, progress=None,
+                       shear=None):
+        return self._call_buffer(self.lib.scramble_keyed_buffer, pixels, iterations, legacy, threads, out,
+                                 progress, shear)
+
+    def unscramble_array(self, pixels, iterations, legacy=False, threads=None, out=None, progress=None,
+                         shear=None):
+        return self._call_buffer(self.lib.unscramble_keyed_buffer, pixels, iterations, legacy, threads, out,
+                                 progress, shear)
+
+
+BACKENDS = {
+    "native": NativeBackend,
+    "numpy": NumpyBackend,
+}
+
+_loaded = {}
+
+
+def load_backend(name):
+    """Instantiate a backend by name, caching it for later calls"""
+    if name not in _loaded:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown backend: {name}")
+        _loaded[name] = BACKENDS[name]()
+    return _loaded[name]
+
+
+def available_backends():
+    """Return the names of the backends that load on this machine"""
+    names = []
+    for name in BACKEND_ORDER:
+        try:
+            load_backend(name)
+        except OSError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(name=None):
+    """Return the requested backend, or the fastest one that loads
+
+    The IMAGE_ENCRYPTOR_BACKEND environment variable overrides the default.
+    """
+    name = name or os.environ.get(BACKEND_ENV)
+    if name:
+        return load_backend(name)
+    for name in BACKEND_ORDER:
+        try:
+            return load_backend(name)
+        except OSError:
+            continue
+    raise RuntimeError("No image encryption backend is available")
+
+
+def as_pixels(image, shape=None):
+    """View an image-like object as a (height, width, channels) array
+
+    Accepts NumPy arrays, anything exposing the buffer protocol (pass
+    `shape` for flat buffers such as bytes) and PIL images. Arrays and
+    shaped buffers are used without copying.
+    """
+    if shape is not None:
+        return np.frombuffer(image, dtype=np.uint8).reshape(shape)
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    if pixels.ndim != 3:
+        raise ValueError("Expected an image of shape (height, width[, channels])")
+    return pixels
+
+
+def _transform_image(image, iterations, inverse, legacy, backend, threads, out, shape, progress=None):
+    engine = get_backend(backend)
+    transform = engine.unscramble_array if inverse else engine.scramble_array
+    if Image is not None and isinstance(image, Image.Image):
+        if image.mode == "1":
+            raise ValueError("1-bit images are not supported; convert to 'L' first")
+        pixels = transform(as_pixels(image), iterations, legacy, threads, progress=progress)
+        result = Image.frombuffer(image.mode, image.size, pixels, "raw", image.mode, 0, 1)
+        if image.mode == "P":
+            result.putpalette(image.getpalette())
+        return result
+    pixels = as_pixels(image, shape)
+    result = transform(pixels, iterations, legacy, threads, None if out is None else as_pixels(out, shape),
+                       progress)
+    return result.reshape(np.shape(image)) if shape is None else result
+
+
+def scramble_image(image, iterations, legacy=False, backend=None, threads=None, out=None, shape=None,
+                   progress=None):
+    """Scramble in-memory pixels with the selected backend, without any file I/O
+
+    PIL images come back as PIL images; everything else as an array of the
+    input's shape. `out` receives the result when given and may be the
+    input itself.
+    """
+    return _transform_image(image, iterations, False, legacy, backend, threads, out, shape, progress)
+
+
+def unscramble_image(image, iterations, legacy=False, backend=None, threads=None, out=None, shape=None,
+                     progress=None):
+    """Unscramble in-memory pixels with the selected backend"""
+    return _transform_image(image, iterations, True, legacy, backend, threads, out, shape, progress)
+
+
+def parse_size(text):
+    """argparse type for an image size, N or WIDTHxHEIGHT, as a (width, height) tuple"""
+    try:
+        parts = [int(part) for part in text.lower().split("x")]
+    except ValueError:
+        parts = []
+    if len(parts) == 1:
+        parts *= 2
+    if len(parts) != 2 or min(parts) <= 0:
+        raise argparse.ArgumentTypeError(f"expected N or WIDTHxHEIGHT, got {text!r}")
+    return tuple(parts)
+
+
+def _extension(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def load_image(path, size=None):
+    """Open an image file for the engines, decoding no more than needed
+
+    PPM and raw RGB(A) payloads are memory-mapped; PNG, BMP and TIFF are
+    decoded by Pillow. Raw files carry no header, so they need
+    size=(width, height).
+    """
+    ext = _extension(path)
+    if ext == ".ppm":
+        return ppm.open_ppm(path)
+    if ext in RAW_CHANNELS:
+        if size is None:
+            raise ValueError(f"Raw {ext} images need size=(width, height)")
+        width, height = size
+        return np.memmap(path, dtype=np.uint8, mode="r", shape=(height, width, RAW_CHANNELS[ext]))
+    if ext in PIL_EXTENSIONS:
+        if Image is None:
+            raise RuntimeError(f"Pillow is required for {ext} images")
+        image = Image.open(path)
+        image.load()
+        return image
+    raise ValueError(f"Unsupported image format: {ext or path}")
+
+
+def save_image(path, image, ext=None):
+    """Write pixels or a PIL image in the format named by the extension
+
+    `ext` overrides the extension of `path`, e.g. for a temporary name.
+    """
+    ext = ext or _extension(path)
+    if Image is not None and isinstance(image, Image.Image):
+        if ext in PIL_EXTENSIONS:
+            image.save(path, format=Image.registered_extensions()[ext])
+            return
+        if image.mode == "P":
+            raise ValueError(f"Palette images cannot be stored as {ext}")
+    pixels = as_pixels(image)
+    channels = pixels.shape[2]
+    if ext == ".ppm":
+        if channels != 3:
+            raise ValueError(f"PPM needs 3 channels, the image has {channels}")
+        ppm.write_ppm(path, pixels)
+    elif ext in RAW_CHANNELS:
+        if channels != RAW_CHANNELS[ext] or pixels.dtype != np.uint8:
+            raise ValueError(f"{ext} needs {RAW_CHANNELS[ext]} 8-bit channels")
+        np.ascontiguousarray(pixels).tofile(path)
+    elif ext in PIL_EXTENSIONS:
+        if Image is None:
+            raise RuntimeError(f"Pillow is required for {ext} images")
+        Image.fromarray(pixels[:, :, 0] if channels == 1 else pixels).save(
+            path, format=Image.registered_extensions()[ext])
+    else:
+        raise ValueError(f"Unsupported image format: {ext or path}")
+
+
+def transform_path(input_path, output_path, iterations, inverse=False, legacy=False,
+                   backend=None, threads=None, size=None, progress=None):
+    """Scramble or unscramble an image file of any supported format
+
+    PPM to PPM stays on the backend's mapped-file path. Anything else is
+    loaded straight into an array (mapped where the format allows),
+    permuted in memory and written beside the target, then renamed.
+    """
+    check_iterations(iterations)
+    engine = get_backend(backend)
+    if _extension(input_path) == _extension(output_path) == ".ppm":
+        method = engine.unscramble if inverse else engine.scramble
+        method(input_path, output_path, iterations, legacy, threads, progress)
+        return
+
+    image = load_image(input_path, size)
+    result = _transform_image(image, iterations, inverse, legacy, backend, threads, None, None, progress)
+    del image
+    # The temporary name ends in .tmp, so a crash never leaves a file that
+    # batch mode would collect as an input
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        save_image(tmp_path, result, _extension(output_path))
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def scramble(input_path, output_path, iterations, legacy=False, backend=None, threads=None, size=None,
+             progress=None):
+    """Scramble an image file with the selected backend"""
+    transform_path(input_path, output_path, iterations, False, legacy, backend, threads, size, progress)
+
+
+def unscramble(input_path, output_path, iterations, legacy=False, backend=None, threads=None, size=None,
+               progress=None):
+    """Unscramble an image file with the selected backend"""
+    transform_path(input_path, output_path, iterations, True, legacy, backend, threads, size, progress)
@@ -0,0 +1,419 @@
+"""Keyed, integrity-checked container for scrambled images
+
+    python container.py encrypt Inputs/photo.ppm photo.catc -k 3 --key-env IMAGE_KEY
+    python container.py verify photo.catc --key-env IMAGE_KEY
+    python container.py decrypt photo.catc photo.ppm --key-env IMAGE_KEY
+    python container.py info photo.catc
+
+A container starts with a header holding the dimensions, sample format,
+iteration count and chunk layout. A digest per chunk follows, then the
+payload. The image is cut into chunks of whole rows, and each chunk is
+scrambled on its own as a width x rows rectangle. Any chunk can be
+verified and unscrambled without the others. Decoding therefore streams
+in bounded memory, runs chunks in parallel, and stops at the first
+corrupt chunk before permuting it.
+
+With a key, a salted PBKDF2 of the key picks the shear pair (p, q) of a
+keyed cat map variant. It also keys the chunk and header digests, and
+gives a check value that rejects a wrong key before any work is done.
+Without a key the classic map is used, and the digests detect
+corruption but not tampering.
+"""
+import argparse
+import hashlib
+import hmac
+import math
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import catmap
+import ppm
+
+MAGIC = b"CATC"
+VERSION = 1
+FLAG_LEGACY = 1
+FLAG_KEYED = 2
+# magic, version, flags, channels, sample bytes, maxval, width, height,
+# iterations, chunk rows, salt, key check
+HEADER = struct.Struct("!4sBBBBHIIQI16s16s")
+DIGEST_SIZE = 16
+SALT_SIZE = 16
+# Default chunk size; whole rows, so a chunk may come out a little smaller
+CHUNK_BYTES = 4 * 1024 * 1024
+KDF_ROUNDS = 100_000
+
+
+class ContainerError(ValueError):
+    """A container is malformed, corrupt, or opened with the wrong key"""
+
+
+def derive_keys(key, salt):
+    """Return (shear, mac_key, check) for a key (str or bytes) and salt
+
+    No key gives the classic map, an empty MAC key and an all-zero check.
+    """
+    if key is None:
+        return (1, 1), b"", bytes(DIGEST_SIZE)
+    if isinstance(key, str):
+        key = key.encode()
+    master = hashlib.pbkdf2_hmac("sha256", key, salt, KDF_ROUNDS)
+
+    def subkey(person, size):
+        return hashlib.blake2b(key=master, person=person, digest_size=size).digest()
+
+    p, q = struct.unpack("!II", subkey(b"catc-shear", 8))
+    # Any positive pair gives a bijection; keep both within a C int
+    shear = (1 + p % 0x7FFFFFFE, 1 + q % 0x7FFFFFFE)
+    return shear, subkey(b"catc-mac", 32), subkey(b"catc-check", DIGEST_SIZE)
+
+
+def chunk_digest(data, index, mac_key):
+    """Digest of one chunk's scrambled bytes, bound to its position"""
+    h = hashlib.blake2b(key=mac_key, digest_size=DIGEST_SIZE, person=b"catc-chunk")
+    h.update(struct.pack("!I", index))
+    h.update(np.ascontiguousarray(data).view(np.uint8))
+    return h.digest()
+
+
+def header_digest(header, table, mac_key):
+    h = hashlib.blake2b(key=mac_key, digest_size=DIGEST_SIZE, person=b"catc-header")
+    h.update(header)
+    h.update(table)
+    return h.digest()
+
+
+class ContainerInfo:
+    """Parsed container header and the layout it implies"""
+
+    def __init__(self, flags, channels, sample_bytes, maxval, width, height, iterations, chunk_rows,
+                 salt, check):
+        self.flags = flags
+        self.channels = channels
+        self.sample_bytes = sample_bytes
+        self.maxval = maxval
+        self.width = width
+        self.height = height
+        self.iterations = iterations
+        self.chunk_rows = chunk_rows
+        self.salt = salt
+        self.check = check
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < HEADER.size or data[:4] != MAGIC:
+            raise ContainerError("Not an image container")
+        magic, version, flags, channels, sample_bytes, maxval, width, height, iterations, chunk_rows, \
+            salt, check = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ContainerError(f"Unsupported container version {version}")
+        if (sample_bytes not in (1, 2) or not 1 <= channels <= 4 or width <= 0 or height <= 0
+                or not 0 < chunk_rows <= height):
+            raise ContainerError("Malformed container header")
+        return cls(flags, channels, sample_bytes, maxval, width, height, iterations, chunk_rows, salt, check)
+
+    def pack(self):
+        return HEADER.pack(MAGIC, VERSION, self.flags, self.channels, self.sample_bytes, self.maxval,
+                           self.width, self.height, self.iterations, self.chunk_rows, self.salt, self.check)
+
+    @property
+    def legacy(self):
+        return bool(self.flags & FLAG_LEGACY)
+
+    @property
+    def keyed(self):
+        return bool(self.flags & FLAG_KEYED)
+
+    @property
+    def dtype(self):
+        # 16-bit samples are stored big-endian, as in PPM
+        return np.dtype(np.uint8) if self.sample_bytes == 1 else np.dtype(">u2")
+
+    @property
+    def shape(self):
+        return (self.height, self.width, self.channels)
+
+    @property
+    def chunk_count(self):
+        return math.ceil(self.height / self.chunk_rows)
+
+    @property
+    def payload_offset(self):
+        return HEADER.size + DIGEST_SIZE * (1 + self.chunk_count)
+
+    @property
+    def file_size(self):
+        return self.payload_offset + self.height * self.width * self.channels * self.sample_bytes
+
+    def chunk_bounds(self, index):
+        """Rows [start, stop) held by chunk `index`"""
+        start = index * self.chunk_rows
+        return start, min(start + self.chunk_rows, self.height)
+
+
+def read_info(path):
+    """Parse a container header without checking it or needing the key"""
+    with open(path, "rb") as f:
+        return ContainerInfo.unpack(f.read(HEADER.size))
+
+
+def _open(path, key):
+    """Check the key and header, returning (info, shear, mac_key, digests, payload)
+
+    Everything here is cheap, so a wrong key or a damaged header fails
+    before any chunk is touched.
+    """
+    info = read_info(path)
+    if info.keyed and key is None:
+        raise ContainerError("Container is keyed; a key is required")
+    if not info.keyed and key is not None:
+        raise ContainerError("Container is not keyed")
+    shear, mac_key, check = derive_keys(key, info.salt)
+    if not hmac.compare_digest(check, info.check):
+        raise ContainerError("Wrong key")
+    if os.path.getsize(path) < info.file_size:
+        raise ContainerError("Truncated container")
+
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        stored = f.read(DIGEST_SIZE)
+        table = f.read(DIGEST_SIZE * info.chunk_count)
+    if not hmac.compare_digest(stored, header_digest(header, table, mac_key)):
+        raise ContainerError("Container header is corrupt")
+    digests = [table[i:i + DIGEST_SIZE] for i in range(0, len(table), DIGEST_SIZE)]
+    payload = np.memmap(path, dtype=info.dtype, mode="r", offset=info.payload_offset, shape=info.shape)
+    return info, shear, mac_key, digests, payload
+
+
+def _check_chunk(info, payload, digests, mac_key, index):
+    start, stop = info.chunk_bounds(index)
+    chunk = payload[start:stop]
+    if not hmac.compare_digest(chunk_digest(chunk, index, mac_key), digests[index]):
+        raise ContainerError(f"Chunk {index} (rows {start}-{stop - 1}) is corrupt")
+    return chunk
+
+
+def write_container(path, image, iterations, key=None, legacy=False, chunk_rows=None, maxval=None,
+                    backend=None, threads=1, workers=None):
+    """Scramble an image into a container file, chunk by chunk
+
+    The output is preallocated and mapped, chunks are scrambled straight
+    into it on a thread pool, and the finished file is renamed into place.
+    """
+    pixels = catmap.as_pixels(image)
+    sample_bytes = pixels.dtype.itemsize
+    if sample_bytes not in (1, 2) or pixels.shape[2] > 4:
+        raise ValueError("Containers hold 8- or 16-bit images of 1 to 4 channels")
+    if sample_bytes == 2:
+        pixels = pixels.astype(">u2", copy=False)
+    height, width, channels = pixels.shape
+    if chunk_rows is None:
+        chunk_rows = max(1, CHUNK_BYTES // (width * channels * sample_bytes))
+    chunk_rows = min(chunk_rows, height)
+
+    salt = os.urandom(SALT_SIZE)
+    shear, mac_key, check = derive_keys(key, salt)
+    flags = (FLAG_LEGACY if legacy else 0) | (FLAG_KEYED if key is not None else 0)
+    info = ContainerInfo(flags, channels, sample_bytes, maxval or ppm.maxval_for(pixels), width, height,
+                         iterations, chunk_rows, salt, check)
+    engine = catmap.get_backend(backend)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.truncate(info.file_size)
+        out = np.memmap(tmp_path, dtype=info.dtype, mode="r+", offset=info.payload_offset, shape=info.shape)
+
+        def encode(index):
+            start, stop = info.chunk_bounds(index)
+            engine.scramble_array(pixels[start:stop], iterations, legacy, threads, out=out[start:stop],
+                                  shear=shear)
+            return chunk_digest(out[start:stop], index, mac_key)
+
+        # The first chunk runs alone so its permutation table is cached
+        # before the pool starts, instead of every worker building it
+        digests = [encode(0)]
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            digests.extend(pool.map(encode, range(1, info.chunk_count)))
+        out.flush()
+        del out
+
+        header = info.pack()
+        table = b"".join(digests)
+        with open(tmp_path, "r+b") as f:
+            f.write(header)
+            f.write(header_digest(header, table, mac_key))
+            f.write(table)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return info
+
+
+def verify(path, key=None):
+    """Return the indices of corrupt chunks; a bad key or header raises"""
+    info, _, mac_key, digests, payload = _open(path, key)
+    bad = []
+    for index in range(info.chunk_count):
+        try:
+            _check_chunk(info, payload, digests, mac_key, index)
+        except ContainerError:
+            bad.append(index)
+    return bad
+
+
+def iter_chunks(path, key=None, backend=None, threads=None):
+    """Yield (start_row, pixels) per chunk, in order, verifying each first
+
+    Only one chunk is held in memory at a time, and a corrupt chunk raises
+    before it is unscrambled.
+    """
+    info, shear, mac_key, digests, payload = _open(path, key)
+    engine = catmap.get_backend(backend)
+    for index in range(info.chunk_count):
+        chunk = _check_chunk(info, payload, digests, mac_key, index)
+        yield info.chunk_bounds(index)[0], engine.unscramble_array(chunk, info.iterations, info.legacy, threads,
+                                                                   shear=shear)
+
+
+def read_container(path, key=None, backend=None, threads=1, workers=None, out=None):
+    """Verify and unscramble a whole container, chunks in parallel
+
+    The first corrupt chunk cancels the chunks not yet started and
+    raises. `out` must be a writable C-contiguous array of the image's
+    shape, such as a mapped output file.
+    """
+    info, shear, mac_key, digests, payload = _open(path, key)
+    engine = catmap.get_backend(backend)
+    if out is None:
+        out = np.empty(info.shape, dtype=info.dtype)
+
+    def decode(index):
+        start, stop = info.chunk_bounds(index)
+        chunk = _check_chunk(info, payload, digests, mac_key, index)
+        engine.unscramble_array(chunk, info.iterations, info.legacy, threads, out=out[start:stop], shear=shear)
+
+    decode(0)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(decode, index) for index in range(1, info.chunk_count)]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    return out
+
+
+def encrypt_file(input_path, output_path, iterations, key=None, legacy=False, chunk_rows=None,
+                 backend=None, threads=1, workers=None, size=None):
+    """Scramble an image file of any supported format into a container"""
+    image = catmap.load_image(input_path, size)
+    maxval = None
+    if isinstance(image, np.ndarray):
+        if input_path.lower().endswith(".ppm"):
+            maxval = ppm.read_header(input_path)[2]
+    elif image.mode in ("1", "P"):
+        # The palette would be lost with the indices
+        image = image.convert("RGB")
+    return write_container(output_path, image, iterations, key, legacy, chunk_rows, maxval, backend, threads,
+                           workers)
+
+
+def decrypt_file(input_path, output_path, key=None, backend=None, threads=1, workers=None):
+    """Unscramble a container into an image file named by its extension
+
+    PPM output is preallocated and mapped, so chunks land directly in the
+    output file.
+    """
+    info = read_info(input_path)
+    if not (output_path.lower().endswith(".ppm") and info.channels == 3):
+        catmap.save_image(output_path, read_container(input_path, key, backend, threads, workers))
+        return
+
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        out = ppm.create_ppm(tmp_path, info.width, info.height, info.maxval)
+        read_container(input_path, key, backend, threads, workers, out=out)
+        out.flush()
+        del out
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_key(args):
+    """Key from --key-env or --key-file; None means an unkeyed container"""
+    if args.key_env:
+        if args.key_env not in os.environ:
+            raise SystemExit(f"Environment variable {args.key_env} is not set")
+        return os.environ[args.key_env]
+    if args.key_file:
+        with open(args.key_file, "rb") as f:
+            return f.read().rstrip(b"\r\n")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keyed, integrity-checked image containers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_key_options(command):
+        # Keys are never taken on the command line, where ps would show them
+        group = command.add_mutually_exclusive_group()
+        group.add_argument("--key-env", metavar="VAR", help="read the key from an environment variable")
+        group.add_argument("--key-file", metavar="PATH", help="read the key from a file")
+
+    encrypt = commands.add_parser("encrypt", help="scramble an image into a container")
+    encrypt.add_argument("input")
+    encrypt.add_argument("output")
+    encrypt.add_argument("-k", "--iterations", type=catmap.iteration_count, default=3)
+    encrypt.add_argument("--legacy", action="store_true", help="use the old k^2 iteration semantics")
+    encrypt.add_argument("--chunk-rows", type=int, help="rows per chunk (default: about 4 MiB)")
+    encrypt.add_argument("--size", type=catmap.parse_size, help="WIDTHxHEIGHT of a raw .rgb/.rgba input")
+    decrypt = commands.add_parser("decrypt", help="verify and unscramble a container")
+    decrypt.add_argument("input")
+    decrypt.add_argument("output")
+    check = commands.add_parser("verify", help="check every chunk without unscrambling")
+    check.add_argument("input")
+    info = commands.add_parser("info", help="print the header")
+    info.add_argument("input")
+    for command in (encrypt, decrypt):
+        command.add_argument("--backend", choices=sorted(catmap.BACKENDS))
+        command.add_argument("-j", "--workers", type=int, help="chunks in flight (default: CPU count)")
+    for command in (encrypt, decrypt, check):
+        add_key_options(command)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "encrypt":
+            encrypt_file(args.input, args.output, args.iterations, read_key(args), args.legacy,
+                         args.chunk_rows, args.backend, workers=args.workers, size=args.size)
+        elif args.command == "decrypt":
+            decrypt_file(args.input, args.output, read_key(args), args.backend, workers=args.workers)
+        elif args.command == "verify":
+            bad = verify(args.input, read_key(args))
+            if bad:
+                print(f"{len(bad)} corrupt chunk(s): {', '.join(str(index) for index in bad)}")
+                return 1
+            print("OK")
+        else:
+            header = read_info(args.input)
+            print(f"{header.width}x{header.height}, {header.channels} x {8 * header.sample_bytes}-bit "
+                  f"(maxval {header.maxval}), k={header.iterations}{' legacy' if header.legacy else ''}, "
+                  f"{header.chunk_count} chunk(s) of {header.chunk_rows} rows, "
+                  f"{'keyed' if header.keyed else 'unkeyed'}")
+    except ContainerError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,94 @@
 import tkinter as tk
 import os
-import ctypes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog, messagebox
 import threading
 import time
 import random
 
+import catmap
+import preview
+
+# Output directory and file name suffix per job type
+JOB_MODES = {
+    "scramble": ("Scrambled", "_scrambled"),
+    "unscramble": ("Outputs", "_unscrambled"),
+}
+POLL_MS = 100
+
+# Matrix rain: a fixed pool of lines, each a column of glyphs fading from
+# bright to dark green. Low-power mode draws fewer lines less often and
+# skips the glyph flicker.
+MATRIX_LINES = 50
+MATRIX_GLYPHS = 20
+MATRIX_GRADIENT = tuple(f'#00{int(255 * (1 - i / MATRIX_GLYPHS)):02x}00' for i in range(MATRIX_GLYPHS))
+FRAME_MS = 50
+LOW_POWER_LINES = 15
+LOW_POWER_FRAME_MS = 200
+# While paused the loop only checks, at this interval, whether to resume
+PAUSED_MS = 500
+LOW_POWER_ENV = "IMAGE_ENCRYPTOR_LOW_POWER"
+# Set to print the main thread's CPU time per animation frame to stdout.
+# Off by default: measuring forces a synchronous redraw every frame.
+FRAME_STATS_ENV = "IMAGE_ENCRYPTOR_FRAME_STATS"
+FRAME_STATS_EVERY = 100
+
+# Thumbnail layout inside the preview canvas
+PREVIEW_MARGIN = 10
+LABEL_HEIGHT = 24
+RESIZE_DEBOUNCE_MS = 200
+
+
+def format_eta(seconds):
+    """Render a remaining time as 42s or 3m05s"""
+    seconds = int(seconds + 0.5)
+    return f"{seconds // 60}m{seconds % 60:02d}s" if seconds >= 60 else f"{seconds}s"
+
+
+class EncryptionJob:
+    """One queued scramble or unscramble and its progress
+
+    The worker thread writes progress through the engine callback; the Tk
+    thread only reads it while polling, so no widget is touched off the
+    main thread.
+    """
+
+    def __init__(self, mode, input_path, output_path, iterations, legacy):
+        self.mode = mode
+        self.input_path = input_path
+        self.output_path = output_path
+        self.iterations = iterations
+        self.legacy = legacy
+        self.done = self.total = 0
+        self.started = None
+        self.future = None
+        self.cancel_event = threading.Event()
+
+    def progress(self, done, total):
+        """Engine callback, run on the worker thread"""
+        if self.cancel_event.is_set():
+            raise catmap.Cancelled(self.input_path)
+        self.done, self.total = done, total
+
+    def cancel(self):
+        # A queued job never starts; a running one stops at its next report
+        self.future.cancel()
+        self.cancel_event.set()
+
+    def describe(self):
+        name = os.path.basename(self.input_path)
+        if self.started is None:
+            return f"{self.mode.upper()} {name} • WAITING"
+        fraction = self.done / self.total if self.total else 0.0
+        bar = "█" * int(fraction * 20) + "░" * (20 - int(fraction * 20))
+        text = f"{self.mode.upper()[:-1]}ING {name} [{bar}] {fraction:.0%}"
+        if fraction > 0:
+            elapsed = time.perf_counter() - self.started
+            text += f" • ETA {format_eta(elapsed * (1 - fraction) / fraction)}"
+        return text
+
+
 class CyberpunkEncryptor:
     def __init__(self):
         # Initialize main window
@@ -18,25 +101,40 @@ class CyberpunkEncryptor:
         # Custom fonts
         self.root.option_add('*Font', ('Courier', 10))
         
-        # Load DLL
+        # Load the fastest available engine (native library or NumPy)
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         try:
-            self.lib = ctypes.CDLL(os.path.join(self.base_dir, "image_encryptor.dll"))
-            self.lib.scramble.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
-            self.lib.unscramble.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+            self.engine = catmap.get_backend()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load DLL: {str(e)}")
+            messagebox.showerror("Error", f"Failed to load encryption backend: {str(e)}")
             exit(1)
 
         # Create directories
         for dir_name in ["Inputs", "Outputs", "Scrambled"]:
             os.makedirs(os.path.join(self.base_dir, dir_name), exist_ok=True)
 
+        # Jobs run one at a time on a worker thread so the window stays live
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.jobs = deque()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Thumbnails are built on their own thread so they never wait
+        # behind a long job
+        self.preview_executor = ThreadPoolExecutor(max_workers=1)
+        self.thumbnails = preview.ThumbnailCache()
+        self.preview_paths = ()
+        self.preview_images = []
+        self.preview_request = None
+        self.resize_after = None
+
         # Initialize variables
         self.current_file = None
         self.is_processing = False
         self.matrix_chars = "10"
         self.matrix_lines = []
+        self.frame_stats = os.environ.get(FRAME_STATS_ENV, "") not in ("", "0")
+        self.frame_count = 0
+        self.frame_cpu_ms = None
         
         self.setup_gui()
         self.start_matrix_animation()
@@ -91,12 +189,13 @@ class CyberpunkEncryptor:
         # Click to select label
         self.select_label = tk.Label(
             self.preview,
-            text="[CLICK TO SELECT PPM FILE]",
+            text="[CLICK TO SELECT IMAGE FILE]",
             font=('Courier', 14),
             fg='#00ff00',
             bg='#000000'
         )
         self.preview.bind('<Button-1>', lambda e: self.select_file())
+        self.preview.bind('<Configure>', self.on_preview_resize)
         
         # Right panel - Controls
         right_panel = tk.Frame(content, bg='#0a0a0a', width=300)
@@ -149,6 +248,34 @@ class CyberpunkEncryptor:
             btn.bind('<Enter>', lambda e, b=btn: b.configure(bg='#003300'))
             btn.bind('<Leave>', lambda e, b=btn: b.configure(bg='#0a0a0a'))
         
+        # Compatibility flag for files scrambled by the old k-pass engine
+        self.legacy_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            right_panel,
+            text="LEGACY MODE (K² PASSES)",
+            variable=self.legacy_var,
+            font=('Courier', 10),
+            fg='#00ff00',
+            bg='#0a0a0a',
+            selectcolor='#0a0a0a',
+            activebackground='#0a0a0a',
+            activeforeground='#00ff00'
+        ).pack(anchor=tk.W)
+
+        # Slower, sparser background animation for always-on machines
+        self.low_power_var = tk.BooleanVar(value=os.environ.get(LOW_POWER_ENV, "") not in ("", "0"))
+        tk.Checkbutton(
+            right_panel,
+            text="LOW POWER MODE",
+            variable=self.low_power_var,
+            font=('Courier', 10),
+            fg='#00ff00',
+            bg='#0a0a0a',
+            selectcolor='#0a0a0a',
+            activebackground='#0a0a0a',
+            activeforeground='#00ff00'
+        ).pack(anchor=tk.W, pady=(0, 20))
+        
         # Action buttons
         self.scramble_btn = tk.Button(
             right_panel,
@@ -176,10 +303,25 @@ class CyberpunkEncryptor:
             height=2,
             command=self.unscramble_image
         )
-        self.unscramble_btn.pack(fill=tk.X)
+        self.unscramble_btn.pack(fill=tk.X, pady=(0, 10))
+
+        self.cancel_btn = tk.Button(
+            right_panel,
+            text="[CANCEL]",
+            font=('Courier', 12, 'bold'),
+            fg='#00ff00',
+            bg='#0a0a0a',
+            activebackground='#00ff00',
+            activeforeground='#000000',
+            bd=1,
+            height=2,
+            state=tk.DISABLED,
+            command=self.cancel_jobs
+        )
+        self.cancel_btn.pack(fill=tk.X)
         
         # Add hover effects to buttons
-        for btn in [self.scramble_btn, self.unscramble_btn]:
+        for btn in [self.scramble_btn, self.unscramble_btn, self.cancel_btn]:
             btn.bind('<Enter>', lambda e, b=btn: b.configure(bg='#003300'))
             btn.bind('<Leave>', lambda e, b=btn: b.configure(bg='#0a0a0a'))
         
@@ -214,54 +356,106 @@ class CyberpunkEncryptor:
         self.root.after(1000, self.blink_subtitle)
 
     def start_matrix_animation(self):
-        """Start the matrix rain animation"""
-        def create_line():
-            x = random.randint(0, self.preview.winfo_width())
-            return {
-                'x': x,
-                'y': -20,
-                'length': random.randint(5, 15),
-                'chars': [random.choice(self.matrix_chars) for _ in range(20)],
-                'speed': random.uniform(1, 3)
-            }
-
-        def animate():
-            if not self.current_file and len(self.matrix_lines) < 50:
-                if random.random() < 0.1:
-                    self.matrix_lines.append(create_line())
-
-            self.preview.delete('matrix')
-            
-            for line in self.matrix_lines[:]:
-                for i, char in enumerate(line['chars']):
-                    y = line['y'] + i * 20
-                    color = f'#00{hex(int(255 * (1 - i/len(line["chars"]))))[2:].zfill(2)}00'
-                    self.preview.create_text(
-                        line['x'], y,
-                        text=char,
-                        fill=color,
-                        font=('Courier', 14),
-                        tags='matrix'
-                    )
-                
-                line['y'] += line['speed']
-                
-                if random.random() < 0.1:
-                    line['chars'] = [random.choice(self.matrix_chars) for _ in range(20)]
-                
-                if line['y'] > self.preview.winfo_height():
-                    self.matrix_lines.remove(line)
-
-            self.preview.tag_lower('matrix')
-            self.root.after(50, animate)
-
-        animate()
+        """Start the matrix rain animation
+
+        Every canvas item is created once here and recycled. A falling
+        line moves with one tagged move() per frame, glyph changes go
+        through itemconfig, and a line that leaves the screen is hidden
+        until it is reused.
+        """
+        for n in range(MATRIX_LINES):
+            tag = f'matrix{n}'
+            items = [
+                self.preview.create_text(
+                    0, 0,
+                    text='',
+                    fill=MATRIX_GRADIENT[i],
+                    font=('Courier', 14),
+                    state=tk.HIDDEN,
+                    tags=('matrix', tag)
+                )
+                for i in range(MATRIX_GLYPHS)
+            ]
+            self.matrix_lines.append({'tag': tag, 'items': items, 'y': 0.0, 'speed': 0.0, 'active': False})
+        self.preview.tag_lower('matrix')
+        self.animate_matrix()
+
+    def spawn_matrix_line(self, line):
+        """Reuse an idle line at a random column above the top edge"""
+        x = random.randint(0, self.preview.winfo_width())
+        line['y'] = -20.0
+        line['speed'] = random.uniform(1, 3)
+        line['active'] = True
+        for i, item in enumerate(line['items']):
+            self.preview.coords(item, x, line['y'] + i * 20)
+        self.shuffle_matrix_line(line)
+        self.preview.itemconfigure(line['tag'], state=tk.NORMAL)
+
+    def shuffle_matrix_line(self, line):
+        for item in line['items']:
+            self.preview.itemconfigure(item, text=random.choice(self.matrix_chars))
+
+    def hide_matrix_lines(self):
+        for line in self.matrix_lines:
+            line['active'] = False
+        self.preview.itemconfigure('matrix', state=tk.HIDDEN)
+
+    def animate_matrix(self):
+        """Advance the matrix rain by one frame
+
+        Paused while the window is minimised or withdrawn, and while a job
+        is running.
+        """
+        if self.is_processing or self.root.state() == 'iconic' or not self.preview.winfo_viewable():
+            self.root.after(PAUSED_MS, self.animate_matrix)
+            return
+
+        # thread_time() leaves out the job and thumbnail worker threads
+        start = time.thread_time() if self.frame_stats else None
+        low_power = self.low_power_var.get()
+        limit = LOW_POWER_LINES if low_power else MATRIX_LINES
+        # Scale the step so lines fall at the same speed at either rate
+        step = LOW_POWER_FRAME_MS / FRAME_MS if low_power else 1
+        active = sum(line['active'] for line in self.matrix_lines)
+
+        if not self.current_file and active < limit and random.random() < 0.1 * step:
+            self.spawn_matrix_line(next(line for line in self.matrix_lines if not line['active']))
+
+        height = self.preview.winfo_height()
+        for line in self.matrix_lines:
+            if not line['active']:
+                continue
+            dy = line['speed'] * step
+            line['y'] += dy
+            if line['y'] > height:
+                line['active'] = False
+                self.preview.itemconfigure(line['tag'], state=tk.HIDDEN)
+                continue
+            self.preview.move(line['tag'], 0, dy)
+            if not low_power and random.random() < 0.1:
+                self.shuffle_matrix_line(line)
+
+        if self.frame_stats:
+            self.record_frame_cost(start, low_power)
+
+        self.root.after(LOW_POWER_FRAME_MS if low_power else FRAME_MS, self.animate_matrix)
+
+    def record_frame_cost(self, start, low_power):
+        """Fold one frame's CPU time into a running average and print it now and then"""
+        # Redraw now so the measurement includes Tk's own work
+        self.preview.update_idletasks()
+        cost = (time.thread_time() - start) * 1000
+        self.frame_cpu_ms = cost if self.frame_cpu_ms is None else 0.95 * self.frame_cpu_ms + 0.05 * cost
+        self.frame_count += 1
+        if self.frame_count % FRAME_STATS_EVERY == 0:
+            mode = "low power" if low_power else "normal"
+            print(f"animation ({mode}): {self.frame_cpu_ms:.2f} ms CPU/frame", flush=True)
 
     def select_file(self):
         """Open file dialog to select an image"""
         path = filedialog.askopenfilename(
-            filetypes=[("PPM Images", "*.ppm")],
-            title="Select PPM Image",
+            filetypes=[("Images", "*.ppm *.png *.bmp *.tif *.tiff"), ("PPM Images", "*.ppm")],
+            title="Select Image",
             initialdir=os.path.join(self.base_dir, "Inputs")
         )
         
@@ -273,9 +467,62 @@ class CyberpunkEncryptor:
                      f"PATH: {os.path.dirname(path)}"
             )
             self.status.configure(text="FILE LOADED • READY TO PROCESS")
-            self.matrix_lines.clear()
-            self.preview.delete('all')
+            self.hide_matrix_lines()
+            self.preview.delete('!matrix')
             self.update_select_label()
+            self.show_preview(path)
+
+    def show_preview(self, *paths):
+        """Render thumbnails of `paths` side by side, sized to the canvas"""
+        self.preview_paths = paths
+        if not paths:
+            return
+        width = self.preview.winfo_width() // len(paths) - 2 * PREVIEW_MARGIN
+        height = self.preview.winfo_height() - 2 * PREVIEW_MARGIN - LABEL_HEIGHT
+        if width <= 0 or height <= 0:
+            return
+        future = self.preview_executor.submit(
+            lambda: [self.thumbnails.get(path, width, height) for path in paths]
+        )
+        self.preview_request = future
+        self.poll_preview(paths, future)
+
+    def poll_preview(self, paths, future):
+        """Draw the thumbnails once built, unless a newer request replaced them"""
+        if future is not self.preview_request:
+            return
+        if not future.done():
+            self.root.after(20, self.poll_preview, paths, future)
+            return
+        try:
+            thumbnails = future.result()
+        except Exception as e:
+            self.status.configure(text=f"PREVIEW UNAVAILABLE: {str(e)}")
+            return
+
+        self.preview.delete('thumbnail')
+        # Tk drops an image as soon as Python holds no reference to it
+        self.preview_images = []
+        slot = self.preview.winfo_width() / len(paths)
+        label_y = self.preview.winfo_height() - PREVIEW_MARGIN - LABEL_HEIGHT / 2
+        for i, (path, pixels) in enumerate(zip(paths, thumbnails)):
+            image = tk.PhotoImage(data=preview.photo_data(pixels), format='PPM')
+            x = slot * (i + 0.5)
+            self.preview.create_image(x, (label_y - LABEL_HEIGHT / 2) / 2, image=image, tags='thumbnail')
+            self.preview.create_text(
+                x, label_y,
+                text=os.path.basename(path).upper(),
+                fill='#00ff00',
+                font=('Courier', 10),
+                tags='thumbnail'
+            )
+            self.preview_images.append(image)
+
+    def on_preview_resize(self, event):
+        # Rebuild once the user stops dragging; unchanged sizes hit the cache
+        if self.resize_after:
+            self.root.after_cancel(self.resize_after)
+        self.resize_after = self.root.after(RESIZE_DEBOUNCE_MS, lambda: self.show_preview(*self.preview_paths))
 
     def show_processing_animation(self):
         """Show processing animation in the preview"""
@@ -304,83 +551,99 @@ class CyberpunkEncryptor:
         self.root.after(10, self.show_processing_animation)
 
     def scramble_image(self):
-        """Scramble the selected image"""
-        if not self.current_file:
-            messagebox.showwarning("Warning", "Please select a file first!")
-            return
-            
-        self.is_processing = True
-        self.scramble_btn.configure(state=tk.DISABLED)
-        self.unscramble_btn.configure(state=tk.DISABLED)
-        self.status.configure(text="SCRAMBLING IMAGE...")
-        self.show_processing_animation()
-        
-        try:
-            output_path = os.path.join(
-                self.base_dir,
-                "Scrambled",
-                os.path.basename(self.current_file).replace(".ppm", "_scrambled.ppm")
-            )
-            
-            self.lib.scramble(
-                self.current_file.encode(),
-                output_path.encode(),
-                int(self.iter_var.get())
-            )
-            
-            self.status.configure(text="SCRAMBLE COMPLETE")
-            messagebox.showinfo("Success", "Image scrambled successfully!")
-            self.current_file = output_path
-            
-        except Exception as e:
-            self.status.configure(text="ERROR DURING SCRAMBLING")
-            messagebox.showerror("Error", f"Failed to scramble image: {str(e)}")
-            
-        finally:
-            self.is_processing = False
-            self.scramble_btn.configure(state=tk.NORMAL)
-            self.unscramble_btn.configure(state=tk.NORMAL)
-            self.preview.delete('processing')
+        """Queue the selected image for scrambling"""
+        self.queue_job("scramble")
 
     def unscramble_image(self):
-        """Unscramble the selected image"""
+        """Queue the selected image for unscrambling"""
+        self.queue_job("unscramble")
+
+    def queue_job(self, mode):
+        """Hand a job to the worker thread and start polling its progress"""
         if not self.current_file:
             messagebox.showwarning("Warning", "Please select a file first!")
             return
-            
-        self.is_processing = True
-        self.scramble_btn.configure(state=tk.DISABLED)
-        self.unscramble_btn.configure(state=tk.DISABLED)
-        self.status.configure(text="UNSCRAMBLING IMAGE...")
-        self.show_processing_animation()
-        
-        try:
-            output_path = os.path.join(
-                self.base_dir,
-                "Outputs",
-                os.path.basename(self.current_file).replace(".ppm", "_unscrambled.ppm")
-            )
-            
-            self.lib.unscramble(
-                self.current_file.encode(),
-                output_path.encode(),
-                int(self.iter_var.get())
-            )
-            
-            self.status.configure(text="UNSCRAMBLE COMPLETE")
-            messagebox.showinfo("Success", "Image unscrambled successfully!")
-            self.current_file = output_path
-            
-        except Exception as e:
-            self.status.configure(text="ERROR DURING UNSCRAMBLING")
-            messagebox.showerror("Error", f"Failed to unscramble image: {str(e)}")
-            
-        finally:
+
+        directory, suffix = JOB_MODES[mode]
+        output_path = os.path.join(
+            self.base_dir,
+            directory,
+            suffix.join(os.path.splitext(os.path.basename(self.current_file)))
+        )
+        job = EncryptionJob(
+            mode,
+            self.current_file,
+            output_path,
+            int(self.iter_var.get()),
+            self.legacy_var.get()
+        )
+        job.future = self.executor.submit(self.run_job, job)
+        self.jobs.append(job)
+        self.cancel_btn.configure(state=tk.NORMAL)
+
+        if not self.is_processing:
+            self.is_processing = True
+            self.show_processing_animation()
+            self.poll_jobs()
+
+    def run_job(self, job):
+        """Run one job on the worker thread"""
+        job.started = time.perf_counter()
+        transform = catmap.scramble if job.mode == "scramble" else catmap.unscramble
+        transform(
+            job.input_path,
+            job.output_path,
+            job.iterations,
+            job.legacy,
+            backend=self.engine.name,
+            progress=job.progress
+        )
+
+    def poll_jobs(self):
+        """Report finished jobs and the progress of the running one"""
+        while self.jobs and self.jobs[0].future.done():
+            self.finish_job(self.jobs.popleft())
+
+        if self.jobs:
+            queued = len(self.jobs) - 1
+            text = self.jobs[0].describe()
+            self.status.configure(text=f"{text} • {queued} QUEUED" if queued else text)
+            self.root.after(POLL_MS, self.poll_jobs)
+        else:
             self.is_processing = False
-            self.scramble_btn.configure(state=tk.NORMAL)
-            self.unscramble_btn.configure(state=tk.NORMAL)
+            self.cancel_btn.configure(state=tk.DISABLED)
             self.preview.delete('processing')
 
+    def finish_job(self, job):
+        """Report one finished job on the Tk thread"""
+        action = job.mode.upper()
+        if job.future.cancelled():
+            self.status.configure(text=f"{action} CANCELLED")
+            return
+        error = job.future.exception()
+        if isinstance(error, catmap.Cancelled):
+            self.status.configure(text=f"{action} CANCELLED")
+        elif error is not None:
+            self.status.configure(text=f"ERROR DURING {action[:-1]}ING")
+            messagebox.showerror("Error", f"Failed to {job.mode} image: {str(error)}")
+        else:
+            self.status.configure(text=f"{action} COMPLETE")
+            self.current_file = job.output_path
+            self.show_preview(job.input_path, job.output_path)
+            messagebox.showinfo("Success", f"Image {job.mode}d successfully!")
+
+    def cancel_jobs(self):
+        """Cancel the running job and everything queued behind it"""
+        for job in self.jobs:
+            job.cancel()
+        self.status.configure(text="CANCELLING...")
+
+    def on_close(self):
+        self.cancel_jobs()
+        self.executor.shutdown(wait=False)
+        self.preview_executor.shutdown(wait=False)
+        self.root.destroy()
+
 if __name__ == "__main__":
     app = CyberpunkEncryptor()
     app.root.mainloop() 
\ No newline at end of file
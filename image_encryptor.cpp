@@ -3,6 +3,25 @@
 #include <vector>
 #include <fstream>
 #include <string>
+#include <cctype>
+#include <cstdio>
+#include <cstring>
+#include <climits>
+#include <cstdint>
+#include <algorithm>
+#include <atomic>
+#include <memory>
+#include <mutex>
+#include <thread>
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
 
 using namespace std;
 
@@ -11,12 +30,752 @@ struct Pixel
     unsigned char r, g, b;
 };
 
+// A pixel of K bytes, moved as an opaque unit by the permutation kernels
+template <int K>
+struct PixelBytes
+{
+    unsigned char bytes[K];
+};
+
+// maxval > 255: three big-endian 16-bit samples
+typedef PixelBytes<6> Pixel16;
+
 struct CatMapParams
 {
+    // Shear factors of the generalized map [[1, p], [q, pq + 1]]; the
+    // classic cat map is p = q = 1, any other pair is a keyed variant
     int p, q;
-    int iterations;
+    long long iterations;
+    // Legacy files were scrambled with k passes of T^k, i.e. T^(k*k)
+    bool legacy;
+};
+
+// Progress shared by the threads of one call, counted in output rows
+// (plus one image height per index-building pass for rectangles). The
+// callback runs under a lock so reports arrive in order, and a non-zero
+// return cancels every worker at its next row block.
+struct Progress
+{
+    ProgressCallback callback;
+    void *context;
+    long long total, done;
+    atomic<bool> cancelled;
+    mutex lock;
+
+    Progress(ProgressCallback callback, void *context)
+        : callback(callback), context(context), total(0), done(0), cancelled(false)
+    {
+    }
+
+    // Record finished work; false once the call has been cancelled
+    bool advance(long long units)
+    {
+        if (!callback)
+            return true;
+        lock_guard<mutex> guard(lock);
+        if (cancelled)
+            return false;
+        done += units;
+        if (callback(done, total, context) != 0)
+            cancelled = true;
+        return !cancelled;
+    }
+};
+
+// Rows per progress report, so each thread reports about 64 times
+static int progressBlock(int rows)
+{
+    return max(1, rows / 64);
+}
+
+static void multiplyMatrix(int a[2][2], int b[2][2], int N, int result[2][2])
+{
+    // 64-bit products so large N cannot overflow before the modulo
+    long long temp[2][2];
+    temp[0][0] = ((long long)a[0][0] * b[0][0] + (long long)a[0][1] * b[1][0]) % N;
+    temp[0][1] = ((long long)a[0][0] * b[0][1] + (long long)a[0][1] * b[1][1]) % N;
+    temp[1][0] = ((long long)a[1][0] * b[0][0] + (long long)a[1][1] * b[1][0]) % N;
+    temp[1][1] = ((long long)a[1][0] * b[0][1] + (long long)a[1][1] * b[1][1]) % N;
+
+    result[0][0] = (int)temp[0][0];
+    result[0][1] = (int)temp[0][1];
+    result[1][0] = (int)temp[1][0];
+    result[1][1] = (int)temp[1][1];
+}
+
+static void powerMatrix(int base[2][2], long long exp, int N, int result[2][2])
+{
+    // Start with identity matrix
+    result[0][0] = 1 % N;
+    result[0][1] = 0;
+    result[1][0] = 0;
+    result[1][1] = 1 % N;
+
+    while (exp > 0)
+    {
+        if (exp % 2 == 1)
+        {
+            multiplyMatrix(result, base, N, result);
+        }
+        multiplyMatrix(base, base, N, base);
+        exp /= 2;
+    }
+}
+
+static void modMatrix(int mat[2][2], int N)
+{
+    for (int i = 0; i < 2; i++)
+        for (int j = 0; j < 2; j++)
+            mat[i][j] = (mat[i][j] % N + N) % N;
+}
+
+// Smallest p > 0 with T^p == I (mod N); the cat map period is at most 3N
+static long long catMapPeriod(int N)
+{
+    if (N <= 1)
+        return 1;
+    long long a = 1, b = 1, c = 1, d = 2;
+    long long period = 1;
+    while (!(a == 1 && b == 0 && c == 0 && d == 1))
+    {
+        long long na = (a + b) % N, nb = (a + 2 * b) % N;
+        long long nc = (c + d) % N, nd = (c + 2 * d) % N;
+        a = na, b = nb, c = nc, d = nd;
+        period++;
+    }
+    return period;
+}
+
+// Net exponent of T for a scramble: k^2 in legacy mode (k passes of
+// T^k each), k otherwise, reduced modulo the period of the map
+static long long netExponent(const CatMapParams &params, int N)
+{
+    long long period = catMapPeriod(N);
+    long long k = params.iterations % period;
+    if (params.legacy)
+        return (k * k) % period;
+    return k;
+}
+
+// Net matrix of one scramble (or unscramble, with inverse) of an N x N image
+static void catMapMatrix(const CatMapParams &params, int N, bool inverse, int M[2][2])
+{
+    if (params.p == 1 && params.q == 1)
+    {
+        int T[2][2] = {{1, 1}, {1, 2}};
+        // Inverse of Arnold matrix mod N
+        int Tinv[2][2] = {{2, -1}, {-1, 1}};
+        modMatrix(Tinv, N);
+        powerMatrix(inverse ? Tinv : T, netExponent(params, N), N, M);
+        return;
+    }
+
+    // Keyed variant: no cheap period to reduce by, and none is needed since
+    // the power is O(log k). Legacy k^2 is taken as (T^k)^k so it cannot
+    // overflow.
+    int p = params.p % N, q = params.q % N;
+    int d = (int)(((long long)p * q + 1) % N);
+    int T[2][2] = {{1 % N, p}, {q, d}};
+    int Tinv[2][2] = {{d, -p}, {-q, 1}};
+    modMatrix(Tinv, N);
+    powerMatrix(inverse ? Tinv : T, params.iterations, N, M);
+    if (params.legacy)
+    {
+        int base[2][2] = {{M[0][0], M[0][1]}, {M[1][0], M[1][1]}};
+        powerMatrix(base, params.iterations, N, M);
+    }
+}
+
+// Single pass: move every pixel of src to (x, y) = M . (j, i) in dst. Along
+// a source row the destination advances by the constant step
+// (M[0][0], M[1][0]), so coordinates are stepped with a conditional
+// subtract instead of two modulos per pixel. src and dst must not overlap.
+template <typename P>
+static void permutePixels(const P *src, P *dst, int N, int M[2][2], Progress *progress = nullptr)
+{
+    int stepX = M[0][0] % N, stepY = M[1][0] % N;
+    int block = progressBlock(N), reported = 0;
+
+    for (int i = 0; i < N; i++)
+    {
+        int x_new = (int)(((long long)M[0][1] * i) % N);
+        int y_new = (int)(((long long)M[1][1] * i) % N);
+        const P *row = src + (size_t)i * N;
+        for (int j = 0; j < N; j++)
+        {
+            dst[(size_t)y_new * N + x_new] = row[j];
+            x_new += stepX;
+            if (x_new >= N)
+                x_new -= N;
+            y_new += stepY;
+            if (y_new >= N)
+                y_new -= N;
+        }
+        if (progress && ((i + 1) % block == 0 || i + 1 == N))
+        {
+            if (!progress->advance(i + 1 - reported))
+                return;
+            reported = i + 1;
+        }
+    }
+}
+
+// Gather destination rows [rowBegin, rowEnd) of dst from src. The source of
+// destination (x, y) is adj(M) . (x, y), which advances by the constant
+// step (M[1][1], -M[1][0]) along a row. Each call writes only its own
+// rows, so threads never share an output cache line except at the seams.
+template <typename P>
+static void gatherRows(const P *src, P *dst, int N, int M[2][2], int rowBegin, int rowEnd,
+                       Progress *progress)
+{
+    int stepJ = M[1][1] % N, stepI = (N - M[1][0] % N) % N;
+    long long negB = (N - M[0][1] % N) % N;
+    int block = progressBlock(rowEnd - rowBegin), reported = rowBegin;
+
+    for (int y = rowBegin; y < rowEnd; y++)
+    {
+        int j = (int)((negB * y) % N);
+        int i = (int)(((long long)M[0][0] * y) % N);
+        P *out = dst + (size_t)y * N;
+        for (int x = 0; x < N; x++)
+        {
+            out[x] = src[(size_t)i * N + j];
+            j += stepJ;
+            if (j >= N)
+                j -= N;
+            i += stepI;
+            if (i >= N)
+                i -= N;
+        }
+        if ((y + 1 - rowBegin) % block == 0 || y + 1 == rowEnd)
+        {
+            if (!progress->advance(y + 1 - reported))
+                return;
+            reported = y + 1;
+        }
+    }
+}
+
+static int resolveThreads(int threads, int limit)
+{
+    if (threads <= 0)
+        threads = (int)thread::hardware_concurrency();
+    return max(1, min(threads, limit));
+}
+
+// Split the output rows evenly across threads (0 = one per hardware
+// thread). A single thread keeps the scatter kernel, which is faster when
+// there is nobody to share the work with.
+template <typename P>
+static void permutePixelsThreaded(const P *src, P *dst, int N, int M[2][2], int threads,
+                                  Progress *progress)
+{
+    threads = resolveThreads(threads, N);
+    if (threads == 1)
+    {
+        permutePixels(src, dst, N, M, progress);
+        return;
+    }
+
+    vector<thread> workers;
+    for (int t = 0; t < threads; t++)
+    {
+        int rowBegin = (int)((long long)N * t / threads);
+        int rowEnd = (int)((long long)N * (t + 1) / threads);
+        workers.emplace_back(gatherRows<P>, src, dst, N, M, rowBegin, rowEnd, progress);
+    }
+    for (auto &worker : workers)
+        worker.join();
+}
+
+// Number of compositions powerPermutation makes for an exponent
+static long long powerPasses(long long exp)
+{
+    long long passes = 0;
+    for (; exp > 0; exp /= 2)
+        passes += (exp % 2) + (exp > 1);
+    return passes;
+}
+
+// Raise a gather permutation to a power by repeated squaring; base is
+// consumed. Powers of one permutation commute, so the order of each
+// composition does not matter. Each composition reports passUnits of
+// progress; returns false if cancelled.
+static bool powerPermutation(vector<uint32_t> &base, long long exp, vector<uint32_t> &result,
+                             Progress *progress, long long passUnits)
+{
+    size_t count = base.size();
+    result.resize(count);
+    for (size_t p = 0; p < count; p++)
+        result[p] = (uint32_t)p;
+
+    vector<uint32_t> temp(count);
+    while (exp > 0)
+    {
+        if (exp % 2 == 1)
+        {
+            for (size_t p = 0; p < count; p++)
+                temp[p] = result[base[p]];
+            result.swap(temp);
+            if (!progress->advance(passUnits))
+                return false;
+        }
+        exp /= 2;
+        if (exp > 0)
+        {
+            for (size_t p = 0; p < count; p++)
+                temp[p] = base[base[p]];
+            base.swap(temp);
+            if (!progress->advance(passUnits))
+                return false;
+        }
+    }
+    return true;
+}
+
+// Generalized cat map for a width x height rectangle. T is the product of
+// two shears, x += p*y (mod width) then y += q*x (mod height), and each
+// shear stays a bijection when width != height; for a square this is
+// exactly [[1, p], [q, pq + 1]].
+// The k-th power has no closed matrix form, so the one-step permutation is
+// raised by repeated squaring. Legacy k^2 is taken as (P^k)^k so large k
+// cannot overflow.
+static bool rectGatherIndex(int width, int height, const CatMapParams &params, bool inverse,
+                            vector<uint32_t> &index, Progress *progress)
+{
+    size_t count = (size_t)width * height;
+    if (count > UINT32_MAX)
+    {
+        cerr << "Error: Image too large for a rectangular cat map" << endl;
+        return false;
+    }
+
+    long long p = params.p % width, q = params.q % height;
+    vector<uint32_t> step(count);
+    for (int y = 0; y < height; y++)
+    {
+        for (int x = 0; x < width; x++)
+        {
+            int x_new = (int)((x + p * y) % width);
+            int y_new = (int)((y + q * x_new) % height);
+            size_t from = (size_t)y * width + x, to = (size_t)y_new * width + x_new;
+            // Scrambling gathers through the inverse of the scatter
+            if (inverse)
+                step[from] = (uint32_t)to;
+            else
+                step[to] = (uint32_t)from;
+        }
+    }
+
+    if (!progress->advance(height) || !powerPermutation(step, params.iterations, index, progress, height))
+        return false;
+    if (params.legacy)
+    {
+        step.swap(index);
+        return powerPermutation(step, params.iterations, index, progress, height);
+    }
+    return true;
+}
+
+// Rectangular tables cost O(log k) passes over the image to build, and a
+// chunked container asks for the same one once per chunk, so the most
+// recently used few are kept, up to a byte budget.
+struct RectIndexKey
+{
+    int width, height, p, q;
+    long long iterations;
+    bool legacy, inverse;
+
+    bool operator==(const RectIndexKey &other) const
+    {
+        return width == other.width && height == other.height && p == other.p && q == other.q &&
+               iterations == other.iterations && legacy == other.legacy && inverse == other.inverse;
+    }
 };
 
+typedef shared_ptr<const vector<uint32_t>> RectIndex;
+
+static const size_t RECT_CACHE_BYTES = 256u << 20;
+static const size_t RECT_CACHE_ENTRIES = 4;
+static mutex rectCacheLock;
+static vector<pair<RectIndexKey, RectIndex>> rectCache;
+
+// Cached table for key, or an empty pointer; a hit moves to the front
+static RectIndex findRectIndex(const RectIndexKey &key)
+{
+    lock_guard<mutex> guard(rectCacheLock);
+    for (size_t i = 0; i < rectCache.size(); i++)
+    {
+        if (rectCache[i].first == key)
+        {
+            rotate(rectCache.begin(), rectCache.begin() + i, rectCache.begin() + i + 1);
+            return rectCache[0].second;
+        }
+    }
+    return RectIndex();
+}
+
+static void storeRectIndex(const RectIndexKey &key, const RectIndex &index)
+{
+    size_t bytes = index->size() * sizeof(uint32_t);
+    if (bytes > RECT_CACHE_BYTES)
+        return;
+    lock_guard<mutex> guard(rectCacheLock);
+    rectCache.insert(rectCache.begin(), make_pair(key, index));
+    size_t total = 0, keep = 0;
+    while (keep < rectCache.size() && keep < RECT_CACHE_ENTRIES &&
+           total + rectCache[keep].second->size() * sizeof(uint32_t) <= RECT_CACHE_BYTES)
+        total += rectCache[keep++].second->size() * sizeof(uint32_t);
+    rectCache.resize(keep);
+}
+
+template <typename P>
+static void gatherIndexed(const P *src, P *dst, const uint32_t *index, int width, int rowBegin, int rowEnd,
+                          Progress *progress)
+{
+    int block = progressBlock(rowEnd - rowBegin);
+    for (int y = rowBegin; y < rowEnd; y += block)
+    {
+        int stop = min(y + block, rowEnd);
+        for (size_t p = (size_t)y * width; p < (size_t)stop * width; p++)
+            dst[p] = src[index[p]];
+        if (!progress->advance(stop - y))
+            return;
+    }
+}
+
+// Permute a width x height image from src into dst (no overlap). Squares
+// use the closed-form matrix kernels; rectangles gather through a
+// precomputed index, with output rows split across threads. Returns false
+// on error or when the progress callback cancels.
+template <typename P>
+static bool transformPixels(const P *src, P *dst, int width, int height, const CatMapParams &params,
+                            bool inverse, int threads, Progress &progress)
+{
+    if (width == height)
+    {
+        int M[2][2];
+        catMapMatrix(params, width, inverse, M);
+        progress.total = height;
+        permutePixelsThreaded(src, dst, width, M, threads, &progress);
+        return !progress.cancelled;
+    }
+
+    long long passes = 1 + powerPasses(params.iterations) * (params.legacy ? 2 : 1);
+    progress.total = height * (passes + 1);
+    RectIndexKey key = {width, height, params.p, params.q, params.iterations, params.legacy, inverse};
+    RectIndex cached = findRectIndex(key);
+    if (cached)
+    {
+        // Skip the build passes so the reported total still adds up
+        if (!progress.advance(height * passes))
+            return false;
+    }
+    else
+    {
+        shared_ptr<vector<uint32_t>> built = make_shared<vector<uint32_t>>();
+        if (!rectGatherIndex(width, height, params, inverse, *built, &progress))
+            return false;
+        cached = built;
+        storeRectIndex(key, cached);
+    }
+    const uint32_t *index = cached->data();
+    threads = resolveThreads(threads, height);
+    vector<thread> workers;
+    for (int t = 0; t < threads; t++)
+    {
+        int rowBegin = (int)((long long)height * t / threads);
+        int rowEnd = (int)((long long)height * (t + 1) / threads);
+        if (threads == 1)
+            gatherIndexed(src, dst, index, width, rowBegin, rowEnd, &progress);
+        else
+            workers.emplace_back(gatherIndexed<P>, src, dst, index, width, rowBegin, rowEnd, &progress);
+    }
+    for (auto &worker : workers)
+        worker.join();
+    return !progress.cancelled;
+}
+
+struct PPMHeader
+{
+    int width, height, maxVal;
+    size_t dataOffset;
+
+    int bytesPerPixel() const { return maxVal > 255 ? 6 : 3; }
+};
+
+// Parse a P6 header. Comments run from '#' to the end of the line and may
+// appear between any two tokens; exactly one whitespace byte separates
+// maxval from the raster.
+static bool parsePPMHeader(const unsigned char *data, size_t size, PPMHeader &header)
+{
+    if (size < 2 || data[0] != 'P' || data[1] != '6')
+    {
+        cerr << "Error: Unsupported format (not P6 PPM)" << endl;
+        return false;
+    }
+
+    size_t pos = 2;
+    long long values[3];
+    for (int k = 0; k < 3; k++)
+    {
+        while (pos < size && (isspace(data[pos]) || data[pos] == '#'))
+        {
+            if (data[pos] == '#')
+                while (pos < size && data[pos] != '\n' && data[pos] != '\r')
+                    pos++;
+            else
+                pos++;
+        }
+        if (pos >= size || !isdigit(data[pos]))
+        {
+            cerr << "Error: Malformed PPM header" << endl;
+            return false;
+        }
+        long long value = 0;
+        while (pos < size && isdigit(data[pos]) && value <= INT_MAX)
+            value = value * 10 + (data[pos++] - '0');
+        values[k] = value;
+    }
+    if (pos >= size || !isspace(data[pos]))
+    {
+        cerr << "Error: Malformed PPM header" << endl;
+        return false;
+    }
+
+    if (values[0] <= 0 || values[1] <= 0 || values[0] > INT_MAX || values[1] > INT_MAX ||
+        values[2] <= 0 || values[2] > 65535)
+    {
+        cerr << "Error: Invalid PPM dimensions or maxval" << endl;
+        return false;
+    }
+    header.width = (int)values[0];
+    header.height = (int)values[1];
+    header.maxVal = (int)values[2];
+    header.dataOffset = pos + 1;
+
+    // Divide rather than multiply: width * height * bytesPerPixel can wrap
+    // size_t for headers that claim billions of pixels a side
+    size_t available = size - header.dataOffset;
+    if (available / header.bytesPerPixel() / header.height < (size_t)header.width)
+    {
+        cerr << "Error: Truncated PPM payload" << endl;
+        return false;
+    }
+    return true;
+}
+
+// A whole file mapped into memory, read-only or freshly created read-write
+class MappedFile
+{
+private:
+#ifdef _WIN32
+    HANDLE file = INVALID_HANDLE_VALUE;
+    HANDLE mapping = NULL;
+#else
+    int fd = -1;
+#endif
+
+public:
+    unsigned char *data = nullptr;
+    size_t size = 0;
+
+    MappedFile() {}
+    MappedFile(const MappedFile &) = delete;
+    MappedFile &operator=(const MappedFile &) = delete;
+    ~MappedFile() { close(); }
+
+    bool openRead(const char *path)
+    {
+#ifdef _WIN32
+        file = CreateFileA(path, GENERIC_READ, FILE_SHARE_READ, NULL, OPEN_EXISTING,
+                           FILE_FLAG_SEQUENTIAL_SCAN, NULL);
+        LARGE_INTEGER length;
+        if (file == INVALID_HANDLE_VALUE || !GetFileSizeEx(file, &length) || length.QuadPart == 0)
+            return fail("Cannot open file", path);
+        size = (size_t)length.QuadPart;
+        mapping = CreateFileMappingA(file, NULL, PAGE_READONLY, 0, 0, NULL);
+        if (mapping)
+            data = (unsigned char *)MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0);
+#else
+        fd = ::open(path, O_RDONLY);
+        struct stat st;
+        if (fd < 0 || fstat(fd, &st) != 0 || st.st_size == 0)
+            return fail("Cannot open file", path);
+        size = (size_t)st.st_size;
+        void *view = mmap(NULL, size, PROT_READ, MAP_SHARED, fd, 0);
+        if (view != MAP_FAILED)
+        {
+            data = (unsigned char *)view;
+            madvise(view, size, MADV_SEQUENTIAL);
+        }
+#endif
+        if (!data)
+            return fail("Cannot map file", path);
+        return true;
+    }
+
+    bool create(const char *path, size_t length)
+    {
+        size = length;
+#ifdef _WIN32
+        file = CreateFileA(path, GENERIC_READ | GENERIC_WRITE, 0, NULL, CREATE_ALWAYS,
+                           FILE_ATTRIBUTE_NORMAL, NULL);
+        if (file == INVALID_HANDLE_VALUE)
+            return fail("Cannot write to file", path);
+        mapping = CreateFileMappingA(file, NULL, PAGE_READWRITE,
+                                     (DWORD)((unsigned long long)length >> 32), (DWORD)length, NULL);
+        if (mapping)
+            data = (unsigned char *)MapViewOfFile(mapping, FILE_MAP_WRITE, 0, 0, 0);
+#else
+        fd = ::open(path, O_RDWR | O_CREAT | O_TRUNC, 0644);
+        if (fd < 0 || ftruncate(fd, (off_t)length) != 0)
+            return fail("Cannot write to file", path);
+        void *view = mmap(NULL, length, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        if (view != MAP_FAILED)
+            data = (unsigned char *)view;
+#endif
+        if (!data)
+            return fail("Cannot map file", path);
+        return true;
+    }
+
+    void close()
+    {
+#ifdef _WIN32
+        if (data)
+            UnmapViewOfFile(data);
+        if (mapping)
+            CloseHandle(mapping);
+        if (file != INVALID_HANDLE_VALUE)
+            CloseHandle(file);
+        mapping = NULL;
+        file = INVALID_HANDLE_VALUE;
+#else
+        if (data)
+            munmap(data, size);
+        if (fd >= 0)
+            ::close(fd);
+        fd = -1;
+#endif
+        data = nullptr;
+    }
+
+private:
+    bool fail(const char *message, const char *path)
+    {
+        cerr << "Error: " << message << " " << path << endl;
+        close();
+        return false;
+    }
+};
+
+static bool replaceFile(const string &from, const string &to)
+{
+#ifdef _WIN32
+    return MoveFileExA(from.c_str(), to.c_str(), MOVEFILE_REPLACE_EXISTING) != 0;
+#else
+    return rename(from.c_str(), to.c_str()) == 0;
+#endif
+}
+
+// Permute one mapped PPM straight into a preallocated, mapped output, so
+// peak memory stays near one frame regardless of image size. The output is
+// built beside the target and renamed into place, which also makes
+// inputPath == outputPath safe.
+static bool transformMappedPPM(const char *inputPath, const char *outputPath,
+                               const CatMapParams &params, bool inverse, int threads, Progress &progress)
+{
+    MappedFile in;
+    PPMHeader header;
+    if (!in.openRead(inputPath) || !parsePPMHeader(in.data, in.size, header))
+        return false;
+
+    int width = header.width, height = header.height;
+    char prefix[64];
+    int prefixLength = snprintf(prefix, sizeof(prefix), "P6\n%d %d\n%d\n", width, height, header.maxVal);
+    size_t payload = (size_t)width * height * header.bytesPerPixel();
+
+    string tmpPath = string(outputPath) + ".tmp";
+    {
+        MappedFile out;
+        if (!out.create(tmpPath.c_str(), prefixLength + payload))
+            return false;
+        memcpy(out.data, prefix, prefixLength);
+
+        const unsigned char *src = in.data + header.dataOffset;
+        unsigned char *dst = out.data + prefixLength;
+        bool ok;
+        if (header.bytesPerPixel() == 3)
+            ok = transformPixels((const Pixel *)src, (Pixel *)dst, width, height, params, inverse, threads,
+                                 progress);
+        else
+            ok = transformPixels((const Pixel16 *)src, (Pixel16 *)dst, width, height, params, inverse, threads,
+                                 progress);
+        if (!ok)
+        {
+            out.close();
+            remove(tmpPath.c_str());
+            return false;
+        }
+    }
+    in.close();
+
+    if (!replaceFile(tmpPath, outputPath))
+    {
+        cerr << "Error: Cannot write to file " << outputPath << endl;
+        remove(tmpPath.c_str());
+        return false;
+    }
+    return true;
+}
+
+// Permute a caller-owned buffer of width x height pixels of type P.
+// src == dst runs in place through one temporary copy; partially
+// overlapping buffers are not supported.
+template <typename P>
+static bool permuteBuffer(const unsigned char *src, unsigned char *dst, int width, int height,
+                          const CatMapParams &params, bool inverse, int threads, Progress &progress)
+{
+    vector<unsigned char> copy;
+    if (src == dst)
+    {
+        copy.assign(src, src + (size_t)width * height * sizeof(P));
+        src = &copy[0];
+    }
+    return transformPixels((const P *)src, (P *)dst, width, height, params, inverse, threads, progress);
+}
+
+static bool transformBuffer(const unsigned char *src, unsigned char *dst, int width, int height,
+                            int channels, const CatMapParams &params, bool inverse, int threads,
+                            Progress &progress)
+{
+    if (!src || !dst || width <= 0 || height <= 0)
+    {
+        cerr << "Error: Invalid image buffer" << endl;
+        return false;
+    }
+
+    switch (channels)
+    {
+    case 1:
+        return permuteBuffer<PixelBytes<1>>(src, dst, width, height, params, inverse, threads, progress);
+    case 2:
+        return permuteBuffer<PixelBytes<2>>(src, dst, width, height, params, inverse, threads, progress);
+    case 3:
+        return permuteBuffer<Pixel>(src, dst, width, height, params, inverse, threads, progress);
+    case 4:
+        return permuteBuffer<PixelBytes<4>>(src, dst, width, height, params, inverse, threads, progress);
+    case 6:
+        return permuteBuffer<Pixel16>(src, dst, width, height, params, inverse, threads, progress);
+    case 8:
+        return permuteBuffer<PixelBytes<8>>(src, dst, width, height, params, inverse, threads, progress);
+    default:
+        cerr << "Error: Unsupported pixel size of " << channels << " bytes" << endl;
+        return false;
+    }
+}
+
 class Image
 {
 private:
@@ -26,41 +785,35 @@ private:
 public:
     Image(int w, int h) : width(w), height(h)
     {
-        pixels.resize(width * height);
+        pixels.resize((size_t)width * height);
     }
 
     int getWidth() const { return width; }
     int getHeight() const { return height; }
 
-    int index(int i, int j) const
+    size_t index(int i, int j) const
     {
-        return i * width + j;
+        return (size_t)i * width + j;
     }
 
     bool readPPM(const string &filename)
     {
-        ifstream file(filename, ios::binary);
-        if (!file)
+        MappedFile file;
+        PPMHeader header;
+        if (!file.openRead(filename.c_str()) || !parsePPMHeader(file.data, file.size, header))
         {
-            cerr << "Error: Cannot open file " << filename << endl;
             return false;
         }
-
-        string format;
-        file >> format;
-        if (format != "P6")
+        if (header.maxVal > 255)
         {
-            cerr << "Error: Unsupported format (not P6 PPM)" << endl;
+            cerr << "Error: Only 8-bit PPM images can be loaded into memory" << endl;
             return false;
         }
 
-        file >> width >> height;
-        int maxVal;
-        file >> maxVal;
-        file.ignore(1);
-
-        pixels.resize(width * height);
-        file.read(reinterpret_cast<char *>(&pixels[0]), width * height * sizeof(Pixel));
+        width = header.width;
+        height = header.height;
+        pixels.resize((size_t)width * height);
+        memcpy(&pixels[0], file.data + header.dataOffset, pixels.size() * sizeof(Pixel));
 
         return true;
     }
@@ -76,7 +829,7 @@ public:
 
         file << "P6\n"
              << width << " " << height << "\n255\n";
-        file.write(reinterpret_cast<const char *>(&pixels[0]), width * height * sizeof(Pixel));
+        file.write(reinterpret_cast<const char *>(&pixels[0]), pixels.size() * sizeof(Pixel));
 
         return true;
     }
@@ -94,38 +847,12 @@ public:
     //         }
     //     }
     // }
-    void multiplyMatrix(int a[2][2], int b[2][2], int N, int result[2][2])
+    void applyMatrix(int M[2][2])
     {
-        int temp[2][2];
-        temp[0][0] = (a[0][0] * b[0][0] + a[0][1] * b[1][0]) % N;
-        temp[0][1] = (a[0][0] * b[0][1] + a[0][1] * b[1][1]) % N;
-        temp[1][0] = (a[1][0] * b[0][0] + a[1][1] * b[1][0]) % N;
-        temp[1][1] = (a[1][0] * b[0][1] + a[1][1] * b[1][1]) % N;
-
-        result[0][0] = temp[0][0];
-        result[0][1] = temp[0][1];
-        result[1][0] = temp[1][0];
-        result[1][1] = temp[1][1];
+        vector<Pixel> temp = pixels;
+        permutePixels(&temp[0], &pixels[0], width, M);
     }
 
-    void powerMatrix(int base[2][2], int exp, int N, int result[2][2])
-    {
-        // Start with identity matrix
-        result[0][0] = 1;
-        result[0][1] = 0;
-        result[1][0] = 0;
-        result[1][1] = 1;
-
-        while (exp > 0)
-        {
-            if (exp % 2 == 1)
-            {
-                multiplyMatrix(result, base, N, result);
-            }
-            multiplyMatrix(base, base, N, base);
-            exp /= 2;
-        }
-    }
     void applyCatMap(const CatMapParams &params)
     {
         int N = width;
@@ -135,21 +862,9 @@ public:
             return;
         }
 
-        int T[2][2] = {{1, 1}, {1, 2}};
         int Tn[2][2];
-        powerMatrix(T, params.iterations, N, Tn);
-
-        vector<Pixel> temp = pixels;
-
-        for (int i = 0; i < N; i++)
-        {
-            for (int j = 0; j < N; j++)
-            {
-                int x_new = (Tn[0][0] * j + Tn[0][1] * i) % N;
-                int y_new = (Tn[1][0] * j + Tn[1][1] * i) % N;
-                pixels[index(y_new, x_new)] = temp[index(i, j)];
-            }
-        }
+        catMapMatrix(params, N, false, Tn);
+        applyMatrix(Tn);
     }
 
     // void applyInverseCatMap(const CatMapParams &params)
@@ -172,12 +887,6 @@ public:
     //         }
     //     }
     // }
-    void modMatrix(int mat[2][2], int N)
-    {
-        for (int i = 0; i < 2; i++)
-            for (int j = 0; j < 2; j++)
-                mat[i][j] = (mat[i][j] % N + N) % N;
-    }
     void applyInverseCatMap(const CatMapParams &params)
     {
         int N = width;
@@ -187,30 +896,9 @@ public:
             return;
         }
 
-        // Inverse of Arnold matrix mod N
-        int Tinv[2][2] = {{2, -1}, {-1, 1}};
-        modMatrix(Tinv, N);
-
-        // Raise to the power of iterations
         int TinvN[2][2];
-        powerMatrix(Tinv, params.iterations, N, TinvN);
-
-        vector<Pixel> temp = pixels;
-
-        for (int i = 0; i < N; i++)
-        {
-            for (int j = 0; j < N; j++)
-            {
-                int x_new = (TinvN[0][0] * j + TinvN[0][1] * i) % N;
-                int y_new = (TinvN[1][0] * j + TinvN[1][1] * i) % N;
-
-                // Ensure non-negative coordinates
-                x_new = (x_new + N) % N;
-                y_new = (y_new + N) % N;
-
-                pixels[index(y_new, x_new)] = temp[index(i, j)];
-            }
-        }
+        catMapMatrix(params, N, true, TinvN);
+        applyMatrix(TinvN);
     }
 
     void scrambleImage(const CatMapParams &params)
@@ -221,10 +909,8 @@ public:
             return;
         }
 
-        for (int i = 0; i < params.iterations; i++)
-        {
-            applyCatMap(params);
-        }
+        // The whole transform is composed up front so every pixel moves once
+        applyCatMap(params);
     }
 
     void unscrambleImage(const CatMapParams &params)
@@ -235,35 +921,118 @@ public:
             return;
         }
 
-        for (int i = 0; i < params.iterations; i++)
-        {
-            applyInverseCatMap(params);
-        }
+        applyInverseCatMap(params);
     }
 };
 
-void scramble(const char *inputPath, const char *outputPath, int iterations)
+// 0 on success, -2 when the progress callback cancelled, -1 on error
+static int statusOf(bool ok, const Progress &progress)
 {
-    Image img(0, 0);
-    if (!img.readPPM(inputPath))
-    {
-        return;
-    }
+    return ok ? 0 : progress.cancelled ? -2 : -1;
+}
 
-    CatMapParams params = {1, 1, iterations};
-    img.scrambleImage(params);
-    img.writePPM(outputPath);
+int scramble_progress(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                      int threads, ProgressCallback callback, void *context)
+{
+    if (iterations < 0)
+        return -1;
+    CatMapParams params = {1, 1, iterations, legacy != 0};
+    Progress progress(callback, context);
+    return statusOf(transformMappedPPM(inputPath, outputPath, params, false, threads, progress), progress);
 }
 
-void unscramble(const char *inputPath, const char *outputPath, int iterations)
+int unscramble_progress(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                        int threads, ProgressCallback callback, void *context)
 {
-    Image img(0, 0);
-    if (!img.readPPM(inputPath))
-    {
-        return;
-    }
+    if (iterations < 0)
+        return -1;
+    CatMapParams params = {1, 1, iterations, legacy != 0};
+    Progress progress(callback, context);
+    return statusOf(transformMappedPPM(inputPath, outputPath, params, true, threads, progress), progress);
+}
+
+int scramble_keyed_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                          long long iterations, int legacy, int p, int q, int threads, ProgressCallback callback,
+                          void *context)
+{
+    if (iterations < 0 || p <= 0 || q <= 0)
+        return -1;
+    CatMapParams params = {p, q, iterations, legacy != 0};
+    Progress progress(callback, context);
+    return statusOf(transformBuffer(src, dst, width, height, channels, params, false, threads, progress),
+                    progress);
+}
+
+int unscramble_keyed_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                            long long iterations, int legacy, int p, int q, int threads,
+                            ProgressCallback callback, void *context)
+{
+    if (iterations < 0 || p <= 0 || q <= 0)
+        return -1;
+    CatMapParams params = {p, q, iterations, legacy != 0};
+    Progress progress(callback, context);
+    return statusOf(transformBuffer(src, dst, width, height, channels, params, true, threads, progress),
+                    progress);
+}
+
+int scramble_buffer_progress(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                             long long iterations, int legacy, int threads, ProgressCallback callback,
+                             void *context)
+{
+    return scramble_keyed_buffer(src, dst, width, height, channels, iterations, legacy, 1, 1, threads, callback,
+                                 context);
+}
+
+int unscramble_buffer_progress(const unsigned char *src, unsigned char *dst, int width, int height,
+                               int channels, long long iterations, int legacy, int threads,
+                               ProgressCallback callback, void *context)
+{
+    return unscramble_keyed_buffer(src, dst, width, height, channels, iterations, legacy, 1, 1, threads,
+                                   callback, context);
+}
+
+int scramble_threaded(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                      int threads)
+{
+    return scramble_progress(inputPath, outputPath, iterations, legacy, threads, nullptr, nullptr);
+}
+
+int unscramble_threaded(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                        int threads)
+{
+    return unscramble_progress(inputPath, outputPath, iterations, legacy, threads, nullptr, nullptr);
+}
+
+int scramble_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                    long long iterations, int legacy, int threads)
+{
+    return scramble_buffer_progress(src, dst, width, height, channels, iterations, legacy, threads, nullptr,
+                                    nullptr);
+}
+
+int unscramble_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                      long long iterations, int legacy, int threads)
+{
+    return unscramble_buffer_progress(src, dst, width, height, channels, iterations, legacy, threads, nullptr,
+                                      nullptr);
+}
+
+int scramble_ex(const char *inputPath, const char *outputPath, long long iterations, int legacy)
+{
+    return scramble_threaded(inputPath, outputPath, iterations, legacy, 1);
+}
 
-    CatMapParams params = {1, 1, iterations};
-    img.unscrambleImage(params);
-    img.writePPM(outputPath);
+int unscramble_ex(const char *inputPath, const char *outputPath, long long iterations, int legacy)
+{
+    return unscramble_threaded(inputPath, outputPath, iterations, legacy, 1);
+}
+
+void scramble(const char *inputPath, const char *outputPath, int iterations)
+{
+    scramble_ex(inputPath, outputPath, iterations, 1);
+}
+
+void unscramble(const char *inputPath, const char *outputPath, int iterations)
+{
+    unscramble_ex(inputPath, outputPath, iterations, 1);
 }
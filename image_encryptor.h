@@ -6,9 +6,61 @@ extern "C"
 {
 #endif
 
+    // Legacy entry points: k passes of T^k (net T^(k*k)), kept for old files
     void scramble(const char *inputPath, const char *outputPath, int iterations);
     void unscramble(const char *inputPath, const char *outputPath, int iterations);
 
+    // Single pass of T^iterations, or T^(iterations^2) when legacy is non-zero.
+    // Files are memory-mapped (8- or 16-bit P6); returns 0 on success, -1 on error
+    // (including a negative iteration count, here and in every export below).
+    int scramble_ex(const char *inputPath, const char *outputPath, long long iterations, int legacy);
+    int unscramble_ex(const char *inputPath, const char *outputPath, long long iterations, int legacy);
+
+    // As the _ex functions, with output rows split across `threads` worker
+    // threads (0 = one per hardware thread)
+    int scramble_threaded(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                          int threads);
+    int unscramble_threaded(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                            int threads);
+
+    // In-memory variants over caller-owned, row-major pixels. `channels` is
+    // the pixel size in bytes (1, 2, 3, 4, 6 or 8: e.g. 3 for RGB8, 6 for
+    // RGB16). dst may equal src for an in-place call but must not otherwise
+    // overlap it. Returns 0 on success, -1 on error.
+    int scramble_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                        long long iterations, int legacy, int threads);
+    int unscramble_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                          long long iterations, int legacy, int threads);
+
+    // Called as work completes with the units done so far and the total for
+    // the call (output rows, plus one image height per index-building pass
+    // on rectangles). It may run on any worker thread, but never on two at
+    // once. Returning non-zero cancels the call.
+    typedef int (*ProgressCallback)(long long done, long long total, void *context);
+
+    // As the _threaded and _buffer functions, reporting to `callback` (which
+    // may be NULL). A cancelled call returns -2 and leaves no output file.
+    int scramble_progress(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                          int threads, ProgressCallback callback, void *context);
+    int unscramble_progress(const char *inputPath, const char *outputPath, long long iterations, int legacy,
+                            int threads, ProgressCallback callback, void *context);
+    int scramble_buffer_progress(const unsigned char *src, unsigned char *dst, int width, int height,
+                                 int channels, long long iterations, int legacy, int threads,
+                                 ProgressCallback callback, void *context);
+    int unscramble_buffer_progress(const unsigned char *src, unsigned char *dst, int width, int height,
+                                   int channels, long long iterations, int legacy, int threads,
+                                   ProgressCallback callback, void *context);
+
+    // Keyed variant of the buffer functions: the map becomes
+    // [[1, p], [q, pq + 1]] (p, q > 0), and rectangles use the shears
+    // x += p*y then y += q*x. p = q = 1 is the classic map.
+    int scramble_keyed_buffer(const unsigned char *src, unsigned char *dst, int width, int height, int channels,
+                              long long iterations, int legacy, int p, int q, int threads,
+                              ProgressCallback callback, void *context);
+    int unscramble_keyed_buffer(const unsigned char *src, unsigned char *dst, int width, int height,
+                                int channels, long long iterations, int legacy, int p, int q, int threads,
+                                ProgressCallback callback, void *context);
+
 #ifdef __cplusplus
 }
 #endif
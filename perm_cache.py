@@ -0,0 +1,121 @@
+"""LRU cache of cat map permutation tables with optional on-disk persistence
+
+A permutation depends only on the image size, the iteration count and the
+direction, so batches that reuse a handful of sizes only ever build each
+table once. Tables are kept in memory up to a byte budget and, when a cache
+directory is configured, saved as .npy files that later processes map
+instead of rebuilding.
+
+Tables are stored as np.intp, the index type np.take works in, and are
+left writable: np.take copies any index that is not, so either would
+cost a full copy of the table per gather. Tables are shared between
+callers, which must treat them as read-only.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_BUDGET = 512 * 1024 * 1024
+CACHE_DIR_ENV = "IMAGE_ENCRYPTOR_CACHE_DIR"
+
+
+class PermutationCache:
+    """Thread-safe LRU of flat gather indices keyed by (N, iterations, direction)"""
+
+    def __init__(self, max_bytes=DEFAULT_BUDGET, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, "perm_" + "_".join(str(part) for part in key) + ".npy")
+
+    def _load(self, key):
+        """Map a previously saved table, or return None"""
+        if not self.directory:
+            return None
+        try:
+            # Copy-on-write: writable as far as NumPy is concerned, but
+            # nothing written to the mapping reaches the file
+            index = np.load(self._path(key), mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+        # Tables saved with a narrower dtype are rebuilt and saved again
+        return index if index.dtype == np.intp else None
+
+    def _save(self, key, index):
+        """Write a table atomically so concurrent processes never map half a file"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, index)
+        os.replace(tmp, path)
+
+    def _insert(self, key, index):
+        if index.nbytes > self.max_bytes:
+            return
+        self._entries[key] = index
+        self.current_bytes += index.nbytes
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def get(self, key, build):
+        """Return the table for `key`, calling `build()` only on a full miss"""
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return index
+
+        index = self._load(key)
+        if index is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            index = np.ascontiguousarray(build(), dtype=np.intp)
+            if self.directory:
+                try:
+                    self._save(key, index)
+                except OSError:
+                    pass
+            with self._lock:
+                self.misses += 1
+
+        with self._lock:
+            if key not in self._entries:
+                self._insert(key, index)
+        return index
+
+    def clear(self):
+        """Drop every in-memory table (files on disk are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return the counters used to size the memory budget"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+default_cache = PermutationCache(directory=os.environ.get(CACHE_DIR_ENV))
@@ -0,0 +1,104 @@
+"""Binary PPM (P6) reading and writing for the Python engines
+
+Besides whole-file reads and writes, open_ppm() and create_ppm() return
+numpy.memmap views over the pixel payload, so an engine can permute from
+one mapped file straight into another without holding either in memory.
+Headers may carry comments, and 16-bit images (maxval up to 65535) use
+big-endian samples as the format requires.
+"""
+import os
+
+import numpy as np
+
+MAX_HEADER_BYTES = 64 * 1024
+
+
+def dtype_for(maxval):
+    """Sample dtype for a maxval: one byte up to 255, big-endian uint16 above"""
+    if not 0 < maxval <= 65535:
+        raise ValueError(f"Invalid PPM maxval: {maxval}")
+    return np.dtype(np.uint8) if maxval < 256 else np.dtype(">u2")
+
+
+def parse_header(data):
+    """Parse a P6 header from bytes, returning (width, height, maxval, offset)
+
+    Comments run from '#' to the end of the line and may appear anywhere
+    between tokens. A single whitespace byte separates maxval from the
+    raster, and offset points just past it.
+    """
+    if data[:2] != b"P6":
+        raise ValueError("Unsupported format (not P6 PPM)")
+    pos = 2
+    values = []
+    while len(values) < 3:
+        while pos < len(data) and (data[pos:pos + 1].isspace() or data[pos:pos + 1] == b"#"):
+            if data[pos:pos + 1] == b"#":
+                while pos < len(data) and data[pos:pos + 1] not in (b"\n", b"\r"):
+                    pos += 1
+            else:
+                pos += 1
+        start = pos
+        while pos < len(data) and data[pos:pos + 1].isdigit():
+            pos += 1
+        if start == pos:
+            raise ValueError("Malformed or truncated PPM header")
+        values.append(int(data[start:pos]))
+    if pos >= len(data) or not data[pos:pos + 1].isspace():
+        raise ValueError("Malformed or truncated PPM header")
+    width, height, maxval = values
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid PPM dimensions: {width}x{height}")
+    dtype_for(maxval)
+    return width, height, maxval, pos + 1
+
+
+def read_header(path):
+    """Read and parse the header of a PPM file on disk"""
+    with open(path, "rb") as f:
+        return parse_header(f.read(MAX_HEADER_BYTES))
+
+
+def open_ppm(path, mode="r"):
+    """Map the payload of an existing PPM as an (height, width, 3) array"""
+    width, height, maxval, offset = read_header(path)
+    if os.path.getsize(path) < offset + width * height * 3 * dtype_for(maxval).itemsize:
+        raise ValueError("Truncated PPM payload")
+    return np.memmap(path, dtype=dtype_for(maxval), mode=mode, offset=offset, shape=(height, width, 3))
+
+
+def format_header(width, height, maxval=255):
+    return b"P6\n%d %d\n%d\n" % (width, height, maxval)
+
+
+def create_ppm(path, width, height, maxval=255):
+    """Preallocate a PPM file and map its payload for writing"""
+    header = format_header(width, height, maxval)
+    with open(path, "wb") as f:
+        f.write(header)
+    return np.memmap(path, dtype=dtype_for(maxval), mode="r+", offset=len(header), shape=(height, width, 3))
+
+
+def read_ppm(path):
+    """Read a P6 PPM file into an (height, width, 3) array"""
+    width, height, maxval, offset = read_header(path)
+    dtype = dtype_for(maxval)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = np.fromfile(f, dtype=dtype, count=width * height * 3)
+    if data.size != width * height * 3:
+        raise ValueError("Truncated PPM payload")
+    return data.reshape(height, width, 3)
+
+
+def maxval_for(pixels):
+    return 255 if pixels.dtype.itemsize == 1 else 65535
+
+
+def write_ppm(path, pixels, maxval=None):
+    """Write an (height, width, 3) uint8 or uint16 array as a P6 PPM file"""
+    height, width = pixels.shape[:2]
+    maxval = maxval or maxval_for(pixels)
+    with open(path, "wb") as f:
+        f.write(format_header(width, height, maxval))
+        f.write(np.ascontiguousarray(pixels, dtype=dtype_for(maxval)).data)
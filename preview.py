@@ -0,0 +1,90 @@
+"""Downsampled previews of large images for the GUI
+
+A thumbnail never decodes the whole image. PPM payloads are memory-mapped
+and sampled with a fixed stride in both directions, so only the pages
+holding the sampled rows are ever read: a 100 MP file previewed at 400
+pixels touches a few percent of its payload. Thumbnails are cached by
+file path, modification time and size, so redraws and side-by-side views
+of files that have not changed are free.
+"""
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import catmap
+import ppm
+
+DEFAULT_ENTRIES = 32
+
+
+def stride_for(width, height, max_width, max_height):
+    """Smallest whole-pixel step that fits width x height in the box"""
+    return max(1, math.ceil(width / max(1, max_width)), math.ceil(height / max(1, max_height)))
+
+
+def thumbnail(path, max_width, max_height, size=None):
+    """Return an 8-bit (height, width, 3) thumbnail that fits the box
+
+    Pixels are nearest samples, not averages, so a thumbnail of a scrambled
+    image shows the noise a viewer would see rather than a grey blur.
+    """
+    image = catmap.load_image(path, size)
+    if catmap.Image is not None and isinstance(image, catmap.Image.Image):
+        stride = stride_for(image.width, image.height, max_width, max_height)
+        image = image.convert("RGB")
+        pixels = np.asarray(image)[::stride, ::stride]
+    else:
+        height, width = image.shape[:2]
+        stride = stride_for(width, height, max_width, max_height)
+        pixels = image[::stride, ::stride]
+    pixels = catmap.as_pixels(pixels)
+    if pixels.dtype.itemsize == 2:
+        pixels = pixels >> 8
+    if pixels.shape[2] == 1:
+        pixels = np.repeat(pixels, 3, axis=2)
+    # Copying the strided view is what reads the sampled pages
+    return np.ascontiguousarray(pixels[:, :, :3], dtype=np.uint8)
+
+
+def photo_data(pixels):
+    """Encode a thumbnail as binary PPM, which tk.PhotoImage(data=...) reads directly"""
+    height, width = pixels.shape[:2]
+    return ppm.format_header(width, height) + np.ascontiguousarray(pixels).tobytes()
+
+
+class ThumbnailCache:
+    """Thread-safe LRU of thumbnails keyed by (path, mtime, file size, box)"""
+
+    def __init__(self, max_entries=DEFAULT_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, max_width, max_height):
+        """Return the thumbnail for `path`, rebuilding it if the file changed"""
+        info = os.stat(path)
+        key = (os.path.abspath(path), info.st_mtime_ns, info.st_size, max_width, max_height)
+        with self._lock:
+            pixels = self._entries.get(key)
+            if pixels is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pixels
+
+        pixels = thumbnail(path, max_width, max_height)
+        pixels.flags.writeable = False
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = pixels
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return pixels
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,402 @@
+"""Long-running local encryption service with a client and load generator
+
+    python service.py serve --socket /tmp/catmap.sock --workers 4
+    python service.py load --socket /tmp/catmap.sock --requests 500 --concurrency 16
+    python service.py stats --socket /tmp/catmap.sock
+
+The server speaks a small length-prefixed protocol over a Unix socket or
+localhost TCP. A request carries raw row-major pixels plus the iteration
+count; the response carries the permuted pixels. Requests go through a
+bounded queue: when it is full, connection handlers stop reading and the
+kernel's socket buffers push back on clients. A dispatcher drains the
+queue, groups requests that share a permutation (same size, pixel size,
+direction and iteration count) and hands each group to a worker thread, so the
+group shares one cached table while it is hot. Both engines release the
+GIL in their kernels, which lets one process keep every table warm for
+all workers.
+"""
+import argparse
+import asyncio
+import json
+import math
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import catmap
+from perm_cache import default_cache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+OP_SCRAMBLE = 0
+OP_UNSCRAMBLE = 1
+OP_STATS = 2
+
+MAGIC = b"CATM"
+# magic, op, legacy, iterations, width, height, bytes per pixel
+REQUEST = struct.Struct("!4sBBqIIB")
+# status (0 = ok), payload length
+RESPONSE = struct.Struct("!BQ")
+MAX_PAYLOAD = 1 << 32
+MAX_SIDE = 1 << 16
+# Pixel sizes the engines accept, in bytes
+PIXEL_BYTES = (1, 2, 3, 4, 6, 8)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram, eight buckets per decade from 10 us"""
+
+    MIN_SECONDS = 1e-5
+    BUCKETS_PER_DECADE = 8
+    DECADES = 7
+
+    def __init__(self):
+        self.counts = [0] * (self.DECADES * self.BUCKETS_PER_DECADE + 2)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = 1 + int(math.log10(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DECADE)
+            bucket = min(bucket, len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p):
+        """Upper edge, in seconds, of the bucket holding the p-th percentile"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.MIN_SECONDS * 10 ** (bucket / self.BUCKETS_PER_DECADE)
+        return self.MIN_SECONDS * 10 ** (len(self.counts) / self.BUCKETS_PER_DECADE)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "p50_ms": 1000 * self.percentile(50),
+            "p90_ms": 1000 * self.percentile(90),
+            "p99_ms": 1000 * self.percentile(99),
+        }
+
+
+class Job:
+    """One queued request and the future its connection is waiting on"""
+
+    __slots__ = ("inverse", "legacy", "iterations", "width", "height", "pixel_bytes",
+                 "payload", "received", "future")
+
+    def __init__(self, inverse, legacy, iterations, width, height, pixel_bytes, payload, future):
+        self.inverse = inverse
+        self.legacy = legacy
+        self.iterations = iterations
+        self.width = width
+        self.height = height
+        self.pixel_bytes = pixel_bytes
+        self.payload = payload
+        self.received = time.perf_counter()
+        self.future = future
+
+    def batch_key(self):
+        """Requests with equal keys use the same permutation table
+
+        The raw parameters are compared rather than the reduced exponent:
+        finding the period of a large size is real work, and this runs on
+        the event loop.
+        """
+        return (self.width, self.height, self.pixel_bytes, self.inverse, self.legacy, self.iterations)
+
+
+def run_group(engine, jobs, threads):
+    """Worker thread: run one group of same-permutation jobs back to back"""
+    results = []
+    for job in jobs:
+        try:
+            pixels = np.frombuffer(job.payload, dtype=np.uint8)
+            pixels = pixels.reshape(job.height, job.width, job.pixel_bytes)
+            transform = engine.unscramble_array if job.inverse else engine.scramble_array
+            result = transform(pixels, job.iterations, job.legacy, threads)
+            results.append((True, memoryview(np.ascontiguousarray(result)).cast("B")))
+        except Exception as e:
+            results.append((False, str(e).encode()))
+    return results
+
+
+def check_request(iterations, width, height, pixel_bytes):
+    """Return why a transform request header is unacceptable, or None"""
+    if pixel_bytes not in PIXEL_BYTES:
+        return f"unsupported pixel size {pixel_bytes}"
+    if not (0 < width <= MAX_SIDE and 0 < height <= MAX_SIDE):
+        return f"image size {width}x{height} is outside 1..{MAX_SIDE}"
+    if width * height * pixel_bytes > MAX_PAYLOAD:
+        return "payload too large"
+    if iterations < 0:
+        return f"iterations must be non-negative, got {iterations}"
+    return None
+
+
+class EncryptionServer:
+    def __init__(self, backend=None, workers=4, queue_size=64, batch_size=16,
+                 batch_window=0.002, threads=1):
+        self.engine = catmap.get_backend(backend)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.threads = threads
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="catmap")
+        self.slots = asyncio.Semaphore(workers)
+        self.latency = LatencyHistogram()
+        self.batches = 0
+        self.batched_jobs = 0
+        self.errors = 0
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until the client hangs up"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST.size)
+                except asyncio.IncompleteReadError:
+                    break
+                magic, op, legacy, iterations, width, height, pixel_bytes = REQUEST.unpack(header)
+                if magic != MAGIC:
+                    raise ProtocolError("bad magic")
+                if op == OP_STATS:
+                    await self.respond(writer, 0, json.dumps(self.stats()).encode())
+                    continue
+                if op not in (OP_SCRAMBLE, OP_UNSCRAMBLE):
+                    raise ProtocolError(f"unknown op {op}")
+                error = check_request(iterations, width, height, pixel_bytes)
+                if error:
+                    # The payload length cannot be trusted, so the
+                    # connection is dropped after the error reply
+                    self.errors += 1
+                    await self.respond(writer, 1, error.encode())
+                    raise ProtocolError(error)
+                length = width * height * pixel_bytes
+                payload = await reader.readexactly(length)
+                job = Job(op == OP_UNSCRAMBLE, bool(legacy), iterations, width, height,
+                          pixel_bytes, payload, loop.create_future())
+                # Blocks while the queue is full: the backpressure point
+                await self.queue.put(job)
+                ok, data = await job.future
+                self.latency.record(time.perf_counter() - job.received)
+                if not ok:
+                    self.errors += 1
+                await self.respond(writer, 0 if ok else 1, data)
+        except (ProtocolError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, data):
+        writer.write(RESPONSE.pack(status, len(data)))
+        writer.write(data)
+        await writer.drain()
+
+    async def dispatch(self):
+        """Drain the queue into same-permutation groups and run them on the pool"""
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(jobs) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job.batch_key(), []).append(job)
+            for group in groups.values():
+                # Holding a slot per running group stops the dispatcher from
+                # pulling more work than the pool can take
+                await self.slots.acquire()
+                self.batches += 1
+                self.batched_jobs += len(group)
+                asyncio.ensure_future(self.run(group))
+
+    async def run(self, group):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, run_group, self.engine, group, self.threads)
+        finally:
+            self.slots.release()
+        for job, result in zip(group, results):
+            job.future.set_result(result)
+
+    def stats(self):
+        return {
+            "backend": self.engine.name,
+            "latency": self.latency.summary(),
+            "queued": self.queue.qsize(),
+            "batches": self.batches,
+            "mean_batch": self.batched_jobs / self.batches if self.batches else 0.0,
+            "errors": self.errors,
+            "cache": default_cache.stats(),
+        }
+
+    async def serve(self, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        dispatcher = asyncio.ensure_future(self.dispatch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self.executor.shutdown(wait=False)
+
+
+class ServiceClient:
+    """Asyncio client for one connection to the service"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        if socket_path:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _request(self, op, legacy=False, iterations=0, width=0, height=0, pixel_bytes=0, payload=b""):
+        self.writer.write(REQUEST.pack(MAGIC, op, legacy, iterations, width, height, pixel_bytes))
+        self.writer.write(payload)
+        await self.writer.drain()
+        status, length = RESPONSE.unpack(await self.reader.readexactly(RESPONSE.size))
+        data = await self.reader.readexactly(length)
+        if status != 0:
+            raise RuntimeError(data.decode(errors="replace"))
+        return data
+
+    async def _transform(self, op, image, iterations, legacy):
+        pixels = catmap.as_pixels(image)
+        height, width = pixels.shape[:2]
+        pixel_bytes = pixels.nbytes // (height * width)
+        data = await self._request(op, legacy, iterations, width, height, pixel_bytes,
+                                   memoryview(np.ascontiguousarray(pixels)).cast("B"))
+        return np.frombuffer(data, dtype=pixels.dtype).reshape(np.shape(image))
+
+    async def scramble(self, pixels, iterations, legacy=False):
+        return await self._transform(OP_SCRAMBLE, pixels, iterations, legacy)
+
+    async def unscramble(self, pixels, iterations, legacy=False):
+        return await self._transform(OP_UNSCRAMBLE, pixels, iterations, legacy)
+
+    async def stats(self):
+        return json.loads(await self._request(OP_STATS))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def generate_load(requests, concurrency, size, iterations, verify=False, **address):
+    """Fire `requests` scrambles over `concurrency` connections and time them"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    latency = LatencyHistogram()
+    remaining = iter(range(requests))
+
+    async def worker():
+        client = await ServiceClient.connect(**address)
+        try:
+            for _ in remaining:
+                start = time.perf_counter()
+                result = await client.scramble(image, iterations)
+                latency.record(time.perf_counter() - start)
+                if verify and not np.array_equal(await client.unscramble(result, iterations), image):
+                    raise RuntimeError("round trip mismatch")
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    client = await ServiceClient.connect(**address)
+    server_stats = await client.stats()
+    await client.close()
+    return {
+        "requests": requests,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "megapixels_per_second": requests * size * size / elapsed / 1e6,
+        "client_latency": latency.summary(),
+        "server": server_stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local image encryption service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the server")
+    load = sub.add_parser("load", help="run the load generator against a server")
+    stats = sub.add_parser("stats", help="print server statistics")
+    for p in (serve, load, stats):
+        p.add_argument("--socket", help="Unix socket path (default: TCP on localhost)")
+        p.add_argument("--host", default=DEFAULT_HOST)
+        p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--backend", choices=sorted(catmap.BACKENDS))
+    serve.add_argument("--workers", type=int, default=4)
+    serve.add_argument("--queue-size", type=int, default=64)
+    serve.add_argument("--batch-size", type=int, default=16)
+    serve.add_argument("--batch-window", type=float, default=2.0, help="milliseconds")
+    serve.add_argument("--threads", type=int, default=1, help="native kernel threads per request")
+    load.add_argument("--requests", type=int, default=200)
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--size", type=int, default=512)
+    load.add_argument("-k", "--iterations", type=catmap.iteration_count, default=3)
+    load.add_argument("--verify", action="store_true", help="also unscramble and compare")
+    args = parser.parse_args(argv)
+    address = {"socket_path": args.socket, "host": args.host, "port": args.port}
+
+    if args.command == "serve":
+        server = EncryptionServer(args.backend, args.workers, args.queue_size, args.batch_size,
+                                  args.batch_window / 1000, args.threads)
+        try:
+            asyncio.run(server.serve(**address))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "load":
+        report = asyncio.run(generate_load(args.requests, args.concurrency, args.size,
+                                           args.iterations, args.verify, **address))
+        print(json.dumps(report, indent=2))
+    else:
+        async def fetch():
+            client = await ServiceClient.connect(**address)
+            try:
+                return await client.stats()
+            finally:
+                await client.close()
+        print(json.dumps(asyncio.run(fetch()), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
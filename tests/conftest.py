@@ -0,0 +1,31 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import catmap
+
+
+@pytest.fixture(scope="session")
+def library_path(tmp_path_factory):
+    """A native library compiled from the current image_encryptor.cpp
+
+    Always built fresh: the library beside the sources is untracked and
+    may be older than them. Skipped where no g++ is available.
+    """
+    compiler = shutil.which("g++")
+    if compiler is None or os.name == "nt":
+        pytest.skip("g++ is needed to build the native library")
+    path = str(tmp_path_factory.mktemp("native") / os.path.basename(catmap.native_library_path()))
+    source = os.path.join(catmap.BASE_DIR, "image_encryptor.cpp")
+    build = subprocess.run([compiler, "-O2", "-pthread", "-shared", "-fPIC", source, "-o", path],
+                           capture_output=True, text=True)
+    if build.returncode != 0:
+        pytest.fail(f"image_encryptor.cpp does not build:\n{build.stderr}")
+    return path
+
+
+@pytest.fixture(scope="session")
+def native(library_path):
+    return catmap.NativeBackend(library_path)
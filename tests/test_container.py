@@ -0,0 +1,160 @@
+"""Round trips and integrity checks of the chunked container format"""
+import os
+
+import numpy as np
+import pytest
+
+import catmap
+import container
+import ppm
+
+KEY = "correct horse"
+CHUNK_ROWS = 8
+
+
+def random_image(height=40, width=24, channels=3, dtype=np.uint8):
+    rng = np.random.default_rng(height * 1000 + width)
+    return rng.integers(0, np.iinfo(dtype).max + 1, (height, width, channels), dtype=dtype)
+
+
+def corrupt_byte(path, offset):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        value = f.read(1)[0]
+        f.seek(offset)
+        f.write(bytes([value ^ 0xFF]))
+
+
+def chunk_offset(info, index):
+    """File offset of the first byte of chunk `index`"""
+    row_bytes = info.width * info.channels * info.sample_bytes
+    return info.payload_offset + info.chunk_bounds(index)[0] * row_bytes
+
+
+@pytest.fixture
+def unscrambled_rows(monkeypatch):
+    """Record the row count of every chunk the NumPy engine unscrambles"""
+    calls = []
+    original = catmap.NumpyBackend.unscramble_array
+
+    def recording(self, pixels, *args, **kwargs):
+        calls.append(pixels.shape[0])
+        return original(self, pixels, *args, **kwargs)
+
+    monkeypatch.setattr(catmap.NumpyBackend, "unscramble_array", recording)
+    return calls
+
+
+@pytest.mark.parametrize("backend", catmap.available_backends())
+@pytest.mark.parametrize("key", [None, KEY])
+@pytest.mark.parametrize("shape, dtype", [((40, 24, 3), np.uint8), ((40, 40, 1), np.uint8),
+                                          ((17, 30, 4), np.uint16)])
+def test_round_trip(tmp_path, backend, key, shape, dtype):
+    pixels = random_image(*shape, dtype=dtype)
+    path = str(tmp_path / "image.catc")
+    info = container.write_container(path, pixels, 3, key, chunk_rows=CHUNK_ROWS, backend=backend)
+    assert info.chunk_count == -(-shape[0] // CHUNK_ROWS)
+    assert os.path.getsize(path) == info.file_size
+    assert container.verify(path, key) == []
+    assert np.array_equal(container.read_container(path, key, backend), pixels)
+
+    streamed = np.empty_like(pixels)
+    for start, chunk in container.iter_chunks(path, key, backend):
+        streamed[start:start + chunk.shape[0]] = chunk
+    assert np.array_equal(streamed, pixels)
+
+
+def test_chunks_are_scrambled(tmp_path):
+    pixels = random_image()
+    path = str(tmp_path / "image.catc")
+    info = container.write_container(path, pixels, 3, KEY, chunk_rows=CHUNK_ROWS)
+    payload = np.fromfile(path, dtype=np.uint8, offset=info.payload_offset).reshape(pixels.shape)
+    assert not np.array_equal(payload, pixels)
+
+
+def test_file_round_trip(tmp_path):
+    pixels = random_image()
+    source, sealed, restored = (str(tmp_path / name) for name in ("in.ppm", "image.catc", "out.ppm"))
+    ppm.write_ppm(source, pixels)
+    container.encrypt_file(source, sealed, 2, KEY, chunk_rows=CHUNK_ROWS)
+    container.decrypt_file(sealed, restored, KEY)
+    assert np.array_equal(ppm.read_ppm(restored), pixels)
+
+
+def test_wrong_key(tmp_path):
+    path = str(tmp_path / "image.catc")
+    container.write_container(path, random_image(), 3, KEY)
+    with pytest.raises(container.ContainerError, match="Wrong key"):
+        container.read_container(path, "not the key")
+
+
+def test_keyed_container_needs_key(tmp_path):
+    path = str(tmp_path / "image.catc")
+    container.write_container(path, random_image(), 3, KEY)
+    with pytest.raises(container.ContainerError, match="key is required"):
+        container.verify(path)
+
+
+def test_unkeyed_container_rejects_key(tmp_path):
+    path = str(tmp_path / "image.catc")
+    container.write_container(path, random_image(), 3)
+    with pytest.raises(container.ContainerError, match="not keyed"):
+        container.verify(path, KEY)
+
+
+def test_truncated(tmp_path):
+    path = str(tmp_path / "image.catc")
+    info = container.write_container(path, random_image(), 3, KEY)
+    with open(path, "r+b") as f:
+        f.truncate(info.file_size - 1)
+    with pytest.raises(container.ContainerError, match="Truncated"):
+        container.read_container(path, KEY)
+
+
+def test_tampered_header(tmp_path):
+    path = str(tmp_path / "image.catc")
+    container.write_container(path, random_image(), 3, KEY, chunk_rows=CHUNK_ROWS)
+    # The low byte of the iteration count
+    corrupt_byte(path, container.HEADER.size - 16 - 16 - 4 - 1)
+    with pytest.raises(container.ContainerError, match="header is corrupt"):
+        container.verify(path, KEY)
+
+
+def test_verify_reports_corrupt_chunk(tmp_path):
+    path = str(tmp_path / "image.catc")
+    info = container.write_container(path, random_image(), 3, KEY, chunk_rows=CHUNK_ROWS)
+    corrupt_byte(path, chunk_offset(info, 2) + 5)
+    assert container.verify(path, KEY) == [2]
+
+
+def test_iter_chunks_stops_before_corrupt_chunk(tmp_path, unscrambled_rows):
+    path = str(tmp_path / "image.catc")
+    info = container.write_container(path, random_image(), 3, KEY, chunk_rows=CHUNK_ROWS, backend="numpy")
+    corrupt_byte(path, chunk_offset(info, 2))
+    starts = []
+    with pytest.raises(container.ContainerError, match="Chunk 2"):
+        for start, _ in container.iter_chunks(path, KEY, "numpy"):
+            starts.append(start)
+    assert starts == [0, CHUNK_ROWS]
+    assert len(unscrambled_rows) == 2
+
+
+def test_read_container_fails_before_unscrambling_corrupt_chunk(tmp_path, unscrambled_rows):
+    path = str(tmp_path / "image.catc")
+    info = container.write_container(path, random_image(), 3, KEY, chunk_rows=CHUNK_ROWS, backend="numpy")
+    corrupt_byte(path, chunk_offset(info, 0) + 1)
+    with pytest.raises(container.ContainerError, match="Chunk 0"):
+        container.read_container(path, KEY, "numpy")
+    # Chunk 0 is decoded alone, before the pool starts
+    assert unscrambled_rows == []
+
+
+def test_decrypt_file_leaves_no_output_on_corruption(tmp_path):
+    pixels = random_image()
+    sealed = str(tmp_path / "image.catc")
+    info = container.write_container(sealed, pixels, 3, KEY, chunk_rows=CHUNK_ROWS)
+    corrupt_byte(sealed, chunk_offset(info, info.chunk_count - 1))
+    for name in ("out.ppm", "out.png"):
+        with pytest.raises(container.ContainerError):
+            container.decrypt_file(sealed, str(tmp_path / name), KEY)
+    assert sorted(os.listdir(tmp_path)) == ["image.catc"]
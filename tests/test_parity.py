@@ -0,0 +1,62 @@
+"""The NumPy engine must match the C++ engine byte for byte
+
+Runs against a library compiled from the current image_encryptor.cpp
+(see conftest.py), and is skipped on machines without g++.
+"""
+import ctypes
+import os
+
+import numpy as np
+import pytest
+
+import catmap
+import ppm
+
+SIZES = (1, 7, 64, 101)
+ITERATIONS = (0, 1, 2, 5)
+
+
+@pytest.fixture(scope="module")
+def legacy_lib(library_path):
+    lib = ctypes.CDLL(library_path)
+    for func in (lib.scramble, lib.unscramble):
+        func.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        func.restype = None
+    return lib
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def random_image(height, width, channels=3):
+    rng = np.random.default_rng(height * 1000 + width)
+    return rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("mode", ["scramble", "unscramble"])
+@pytest.mark.parametrize("k", ITERATIONS)
+@pytest.mark.parametrize("n", SIZES)
+def test_legacy_exports(legacy_lib, tmp_path, n, k, mode):
+    source, expected, actual = (str(tmp_path / name) for name in ("in.ppm", "native.ppm", "numpy.ppm"))
+    ppm.write_ppm(source, random_image(n, n))
+    getattr(legacy_lib, mode)(os.fsencode(source), os.fsencode(expected), k)
+    getattr(catmap.NumpyBackend(), mode)(source, actual, k, legacy=True)
+    assert read_bytes(actual) == read_bytes(expected)
+
+
+@pytest.mark.parametrize("shear", [None, (3, 5)])
+@pytest.mark.parametrize("legacy", [False, True])
+@pytest.mark.parametrize("shape", [(64, 64), (37, 64), (64, 37)])
+def test_array_entry_points(native, shape, legacy, shear):
+    pixels = random_image(*shape)
+    numpy_engine = catmap.NumpyBackend()
+    for k in (1, 3, 10 ** 6 + 3):
+        if legacy and (shear or k > 10):
+            continue
+        scrambled = native.scramble_array(pixels, k, legacy, shear=shear)
+        assert np.array_equal(scrambled, numpy_engine.scramble_array(pixels, k, legacy, shear=shear))
+        restored = native.unscramble_array(scrambled, k, legacy, shear=shear)
+        assert np.array_equal(restored, numpy_engine.unscramble_array(scrambled, k, legacy, shear=shear))
+        assert np.array_equal(restored, pixels)
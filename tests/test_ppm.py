@@ -0,0 +1,103 @@
+"""P6 header parsing and payload mapping, in Python and in the C++ engine"""
+import numpy as np
+import pytest
+
+import catmap
+import ppm
+
+
+def write_raw(path, header, payload):
+    with open(path, "wb") as f:
+        f.write(header + payload)
+    return str(path)
+
+
+@pytest.mark.parametrize("header", [
+    b"P6\n3 2\n255\n",
+    b"P6 3 2 255 ",
+    b"P6#after magic\n3 2\n255\n",
+    b"P6\n# a comment line\n3\n# between width and height\n2 # trailing\n255\n",
+    b"P6\n3#no space\n2\n#before maxval\n255\n",
+    b"P6\r\n3\t2\r\n255\r",
+])
+def test_header_tokens_and_comments(header):
+    assert ppm.parse_header(header + b"rest") == (3, 2, 255, len(header))
+
+
+@pytest.mark.parametrize("header", [
+    b"P3\n3 2\n255\n",
+    b"P6\n3 2\n",
+    b"P6\n3 2\n255",
+    b"P6\n3 x 255\n",
+    b"P6\n0 2\n255\n",
+    b"P6\n3 2\n0\n",
+    b"P6\n3 2\n65536\n",
+    b"P6\n3 2\n255#comment\n",
+])
+def test_malformed_headers(header):
+    with pytest.raises(ValueError):
+        ppm.parse_header(header)
+
+
+def test_single_whitespace_byte_before_raster(tmp_path):
+    # The raster starts with bytes that look like whitespace; only the
+    # one byte after maxval belongs to the header
+    payload = b"\n \t\r\x0b\x0c"
+    path = write_raw(tmp_path / "ws.ppm", b"P6 2 1 255\n", payload)
+    assert ppm.read_ppm(path).tobytes() == payload
+    assert ppm.open_ppm(path).tobytes() == payload
+
+
+def test_16_bit_samples_are_big_endian(tmp_path):
+    payload = bytes([0x12, 0x34, 0xFF, 0xFE, 0x00, 0x01])
+    path = write_raw(tmp_path / "deep.ppm", b"P6\n1 1\n65535\n", payload)
+    pixels = ppm.read_ppm(path)
+    assert pixels.dtype == np.dtype(">u2")
+    assert pixels.reshape(-1).tolist() == [0x1234, 0xFFFE, 0x0001]
+    assert np.array_equal(ppm.open_ppm(path), pixels)
+
+    out = str(tmp_path / "copy.ppm")
+    ppm.write_ppm(out, pixels.astype(np.uint16))
+    with open(out, "rb") as f:
+        assert f.read().endswith(payload)
+
+
+def test_truncated_payload(tmp_path):
+    path = write_raw(tmp_path / "short.ppm", b"P6\n2 2\n255\n", bytes(11))
+    with pytest.raises(ValueError, match="Truncated"):
+        ppm.read_ppm(path)
+    with pytest.raises(ValueError, match="Truncated"):
+        ppm.open_ppm(path)
+
+
+def commented_16_bit(path, height, width):
+    rng = np.random.default_rng(7)
+    pixels = rng.integers(0, 65536, (height, width, 3), dtype=np.uint16)
+    header = b"P6\n# written by hand\n%d # width\n%d\n#maxval next\n65535\n" % (width, height)
+    return write_raw(path, header, pixels.astype(">u2").tobytes()), pixels
+
+
+@pytest.mark.parametrize("shape", [(32, 32), (20, 45)])
+@pytest.mark.parametrize("mode", ["scramble", "unscramble"])
+def test_native_matches_numpy_on_commented_16_bit(native, tmp_path, shape, mode):
+    source, _ = commented_16_bit(tmp_path / "in.ppm", *shape)
+    expected, actual = str(tmp_path / "numpy.ppm"), str(tmp_path / "native.ppm")
+    getattr(catmap.NumpyBackend(), mode)(source, expected, 3)
+    getattr(native, mode)(source, actual, 3)
+    with open(expected, "rb") as a, open(actual, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_native_rejects_truncated_payload(native, tmp_path):
+    path = write_raw(tmp_path / "short.ppm", b"P6\n4 4\n65535\n", bytes(4 * 4 * 6 - 1))
+    with pytest.raises(RuntimeError):
+        native.scramble(path, str(tmp_path / "out.ppm"), 1)
+
+
+def test_native_rejects_size_that_wraps(native, tmp_path, capfd):
+    # 1756651349 * 1750180733 * 6 bytes is 2^64 + 1286, so a multiplied
+    # size check wraps around and sees a tiny payload
+    path = write_raw(tmp_path / "huge.ppm", b"P6\n1756651349 1750180733\n65535\n", bytes(1286))
+    with pytest.raises(RuntimeError):
+        native.scramble(path, str(tmp_path / "out.ppm"), 1)
+    assert "Truncated PPM payload" in capfd.readouterr().err